@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pyproj
+import shapely
+from geopandas import GeoDataFrame
+
+from GenerateTiles import WGS84, clean_parcel_data_frame, concat, filter_intersecting_buildings, \
+    geojson_feature_lines, join_footprints_parcels, peak_rss_mb, reproject, write_tiles_native
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+OHIO_SOUTH = pyproj.CRS.from_epsg(3735)  # State Plane, US feet, same as the county's extracts
+
+# Downtown Columbus in State Plane feet
+ORIGIN_X = 1820000
+ORIGIN_Y = 720000
+
+LOT_WIDTH = 60
+LOT_DEPTH = 120
+
+
+def generate_parcels(count: int, rng: np.random.Generator) -> GeoDataFrame:
+    # A grid of lots, like the county's residential blocks
+    columns = int(np.ceil(np.sqrt(count * LOT_DEPTH / LOT_WIDTH)))
+    positions = np.arange(count)
+    min_x = ORIGIN_X + (positions % columns) * LOT_WIDTH
+    min_y = ORIGIN_Y + (positions // columns) * LOT_DEPTH
+    geometries = shapely.box(min_x, min_y, min_x + LOT_WIDTH, min_y + LOT_DEPTH)
+
+    # Mostly the usual ids, with the odd condo suffix, stray whitespace or letters that cleaning has to deal with
+    parcel_ids = np.array([f'010-{number:06d}' for number in positions], dtype=object)
+    suffixed = rng.random(count) < 0.2
+    parcel_ids[suffixed] = [f'{parcel_id}-00' for parcel_id in parcel_ids[suffixed]]
+    padded = rng.random(count) < 0.05
+    parcel_ids[padded] = [f' {parcel_id} ' for parcel_id in parcel_ids[padded]]
+    lettered = rng.random(count) < 0.01
+    parcel_ids[lettered] = [f'{parcel_id}A' for parcel_id in parcel_ids[lettered]]
+
+    # Mostly sane years, with some unknown (0) ones that cleaning drops
+    years_built = rng.integers(1850, 2024, count)
+    years_built[rng.random(count) < 0.05] = 0
+
+    # Named the way load_parcels leaves them
+    return GeoDataFrame({'parcel_id': parcel_ids, 'year_built': years_built}, geometry=geometries, crs=OHIO_SOUTH)
+
+
+def generate_footprints(parcels: GeoDataFrame, count: int, rng: np.random.Generator) -> GeoDataFrame:
+    # Houses sit inside their lot, some of them are nudged across the lot line so the join has to compare overlaps
+    lots = rng.integers(0, len(parcels), count)
+    bounds = shapely.bounds(np.asarray(parcels.geometry.values))[lots]
+    width = rng.uniform(20, 45, count)
+    depth = rng.uniform(25, 60, count)
+    min_x = bounds[:, 0] + rng.uniform(0, LOT_WIDTH - width)
+    min_y = bounds[:, 1] + rng.uniform(0, LOT_DEPTH - depth)
+
+    straddling = rng.random(count) < 0.1
+    min_x[straddling] += rng.uniform(-LOT_WIDTH / 2, LOT_WIDTH / 2, np.count_nonzero(straddling))
+
+    geometries = shapely.box(min_x, min_y, min_x + width, min_y + depth)
+    return GeoDataFrame(geometry=geometries, crs=OHIO_SOUTH)
+
+
+def generate_osu_buildings(footprints: GeoDataFrame, count: int, rng: np.random.Generator) -> GeoDataFrame:
+    # OSU draws many of the same buildings the county does, some exactly and some slightly offset
+    sources = rng.choice(len(footprints), min(count, len(footprints)), replace=False)
+    geometries = np.asarray(footprints.geometry.values)[sources]
+    offset = rng.random(len(sources)) < 0.5
+    geometries[offset] = shapely.transform(geometries[offset], lambda coordinates: coordinates + 2)
+
+    years_built = rng.integers(1870, 2024, len(sources)).astype(np.uint16)
+    return GeoDataFrame({'year_built': years_built}, geometry=geometries, crs=OHIO_SOUTH)
+
+
+def generate_fixtures(scale: int, seed: int) -> Tuple[GeoDataFrame, GeoDataFrame, GeoDataFrame]:
+    rng = np.random.default_rng(seed)
+    parcels = generate_parcels(int(scale * 1.1), rng)
+    footprints = generate_footprints(parcels, scale, rng)
+    osu_buildings = generate_osu_buildings(footprints, max(scale // 100, 1), rng)
+    return footprints, parcels, osu_buildings
+
+
+def timed(name: str, function: Callable, results: Dict[str, float]):
+    start_time = time.perf_counter()
+    value = function()
+    results[name] = time.perf_counter() - start_time
+    logger.info(f'{name}: {results[name]:.2f}s (peak RSS {peak_rss_mb():.0f} MB)')
+    return value
+
+
+def run_benchmarks(scale: int, seed: int, workers: int, tiles: bool) -> Dict[str, float]:
+    timings = {}
+    footprints, raw_parcels, osu_buildings = timed(
+        'generate_fixtures', lambda: generate_fixtures(scale, seed), timings
+    )
+    osu_buildings = reproject(osu_buildings, WGS84)
+
+    parcels = timed('clean_parcel_data_frame', lambda: clean_parcel_data_frame(raw_parcels), timings)
+    footprints_with_years = timed(
+        'join_footprints_parcels', lambda: join_footprints_parcels(footprints, parcels, workers), timings
+    )
+    footprints_with_years = reproject(footprints_with_years, WGS84)
+
+    final_df = timed('filter_intersecting_buildings',
+                     lambda: filter_intersecting_buildings(concat(footprints_with_years, osu_buildings)), timings)
+
+    with tempfile.TemporaryDirectory() as temp_dir_name:
+        def serialize_geojson_lines() -> None:
+            with open(os.devnull, 'w') as f:
+                f.writelines(geojson_feature_lines(final_df))
+
+        timed('geojson_feature_lines', serialize_geojson_lines, timings)
+        timed('to_file_geojson',
+              lambda: final_df.to_file(f'{temp_dir_name}/buildings.geojson', driver='GeoJSON'), timings)
+        if tiles:
+            timed('write_tiles_native',
+                  lambda: write_tiles_native(final_df, f'{temp_dir_name}/buildings.mbtiles', workers), timings)
+
+    return timings
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def load_results(results_file_name: str) -> List[Dict]:
+    if not os.path.isfile(results_file_name):
+        return []
+
+    with open(results_file_name, 'r') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+# Compares against the most recent earlier run with the same settings, returning the benchmarks that got slower
+def find_regressions(result: Dict, previous_results: List[Dict], tolerance: float) -> List[str]:
+    settings = ('scale', 'seed', 'workers')
+    comparable = [previous for previous in previous_results
+                  if all(previous[setting] == result[setting] for setting in settings)]
+    if not comparable:
+        return []
+
+    baseline = comparable[-1]
+    regressions = []
+    for name, seconds in result['timings'].items():
+        baseline_seconds = baseline['timings'].get(name)
+        if baseline_seconds is not None and seconds > baseline_seconds * tolerance:
+            regressions.append(f'{name}: {baseline_seconds:.2f}s at {baseline["revision"]} -> {seconds:.2f}s')
+
+    return regressions
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Times the tile pipeline on synthetic Franklin County sized data')
+    parser.add_argument('--scale', type=int, default=10_000, help='Number of footprints to generate (10k to 1M)')
+    parser.add_argument('--seed', type=int, default=129, help='Seed for the fixture generator')
+    parser.add_argument('--workers', type=int, default=1, help='Passed on like GenerateTiles.py --workers')
+    parser.add_argument('--tiles', action='store_true', help='Also time the native MBTiles writer')
+    parser.add_argument('--results', default='./data/benchmarks.jsonl', help='File the results get appended to')
+    parser.add_argument('--tolerance', type=float, default=1.25,
+                        help='How many times slower than the last comparable run counts as a regression')
+    return parser.parse_args()
+
+
+def main(args: argparse.Namespace):
+    os.makedirs(os.path.dirname(args.results) or '.', exist_ok=True)
+
+    result = {
+        'started_at': datetime.now().isoformat(),
+        'revision': git_revision(),
+        'scale': args.scale,
+        'seed': args.seed,
+        'workers': args.workers,
+        'timings': run_benchmarks(args.scale, args.seed, args.workers, args.tiles),
+        'peak_rss_mb': peak_rss_mb()
+    }
+
+    regressions = find_regressions(result, load_results(args.results), args.tolerance)
+    with open(args.results, 'a') as f:
+        f.write(json.dumps(result) + '\n')
+
+    if regressions:
+        logger.error('Regressions:\n' + '\n'.join(regressions))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(format='%(message)s')
+    main(parse_args())
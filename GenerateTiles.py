@@ -1,222 +1,865 @@
 #!/usr/bin/env python3
+import argparse
+import gzip
+import hashlib
 import json
 import logging
+import math
 import os
 import re
+import resource
+import sqlite3
 import subprocess
 import sys
-import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from concurrent.futures.thread import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass, asdict
+from datetime import datetime, timedelta
+from functools import lru_cache
 from ftplib import FTP
-from io import StringIO
 from pathlib import Path
-from typing import Iterable, Hashable, Dict
+from typing import Callable, Iterable, Iterator, Dict, List, Optional, TextIO, Tuple
 from zipfile import ZipFile
 
-import fiona
 import geopandas as gpd
+import mapbox_vector_tile
+import numpy as np
 import pandas as pd
+import pyogrio.raw
+import pyproj
 import requests
+import shapely
 from geopandas import GeoDataFrame
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
 
 
-def download_franklin_county_building_footprints(data_dir: str) -> str:
-    with FTP('apps.franklincountyauditor.com') as ftp:
-        ftp.login()
-        ftp.cwd('GIS_Shapefiles')
-        ftp.cwd('CurrentExtracts')
+def load_manifest(manifest_file_name: str) -> Dict:
+    if os.path.isfile(manifest_file_name):
+        with open(manifest_file_name, 'r') as f:
+            return json.load(f)
+    else:
+        return {}
+
+
+def save_manifest(manifest: Dict, manifest_file_name: str) -> None:
+    with open(manifest_file_name, 'w') as f:
+        json.dump(manifest, f)
+
+
+def retrieve_with_resume(ftp: FTP, remote_file_name: str, local_file_name: str, remote_size: int) -> None:
+    offset = os.path.getsize(local_file_name) if os.path.isfile(local_file_name) else 0
+    if offset > remote_size:
+        offset = 0
+
+    # The transfer finished but wasn't renamed yet. Many servers refuse a REST at the very end of the file.
+    if offset == remote_size and os.path.isfile(local_file_name):
+        logger.debug(f'{remote_file_name} was already fully downloaded...')
+        return
 
-        building_footprint_file_name = next(file_name for file_name in ftp.nlst() if 'BuildingFootprints' in file_name)
-        output_folder = f'{data_dir}/{building_footprint_file_name}'.replace('.zip', '')
+    if offset > 0:
+        logger.debug(f'Resuming {remote_file_name} at {offset // 1000000} of {remote_size // 1000000} MB...')
 
-        # Only downloads if the unzipped contents don't exist already
-        if not Path(output_folder).is_dir():
-            logger.debug(f'Downloading {building_footprint_file_name}...')
-            with tempfile.TemporaryDirectory() as temp_dir_name:
-                zip_file_name = f'{temp_dir_name}/{building_footprint_file_name}'
-                with open(zip_file_name, 'wb') as fp:
-                    ftp.retrbinary(f'RETR {building_footprint_file_name}', fp.write)
-                with ZipFile(zip_file_name) as zip_ref:
-                    zip_ref.extractall(output_folder)
+    start_time = time.perf_counter()
+    received = 0
+    next_progress_report = 0
 
-    logger.debug(f'Using {building_footprint_file_name}...')
-    return output_folder
+    with open(local_file_name, 'ab' if offset > 0 else 'wb') as fp:
+        def write_block(block: bytes) -> None:
+            nonlocal received, next_progress_report
+            fp.write(block)
+            received += len(block)
 
+            if received >= next_progress_report:
+                elapsed = max(time.perf_counter() - start_time, 1e-6)
+                logger.debug(f'{remote_file_name}: {(offset + received) // 1000000} of {remote_size // 1000000} MB '
+                             f'({received / elapsed / 1000000:.1f} MB/s)...')
+                next_progress_report += 50 * 1000000
 
-def download_franklin_county_parcel_polygons(data_dir: str) -> str:
-    with FTP('apps.franklincountyauditor.com') as ftp:
+        ftp.retrbinary(f'RETR {remote_file_name}', write_block, rest=offset if offset > 0 else None)
+
+    elapsed = max(time.perf_counter() - start_time, 1e-6)
+    logger.debug(f'Downloaded {received // 1000000} MB of {remote_file_name} in {elapsed:.1f}s '
+                 f'({received / elapsed / 1000000:.1f} MB/s)...')
+
+    if os.path.getsize(local_file_name) != remote_size:
+        raise IOError(f'Downloaded {os.path.getsize(local_file_name)} bytes of {remote_file_name}, '
+                      f'expected {remote_size}')
+
+
+# Downloads the first file in the FTP directory whose name contains file_name_substring and returns where it was
+# saved. The download is skipped if the file is there and the remote file's size and modification time match the
+# manifest recorded for it, and an interrupted download picks up where it left off.
+def download_from_ftp(host: str, directory: str, file_name_substring: str, data_dir: str, port: int = 21) -> str:
+    with FTP() as ftp:
+        ftp.connect(host, port)
         ftp.login()
-        ftp.cwd('GIS_Shapefiles')
-        ftp.cwd('CurrentExtracts')
+        for part in directory.split('/'):
+            ftp.cwd(part)
 
-        parcel_polygons_file_name = next(file_name for file_name in ftp.nlst() if 'Parcel_Polygons' in file_name)
-        output_folder = f'{data_dir}/{parcel_polygons_file_name}'.replace('.zip', '')
+        file_name = next(file_name for file_name in ftp.nlst() if file_name_substring in file_name)
+        output_file_name = f'{data_dir}/{file_name}'
+        partial_file_name = f'{output_file_name}.part'
+        manifest_file_name = f'{output_file_name}.manifest.json'
 
-        # Only downloads if the unzipped contents don't exist already
-        if not Path(output_folder).is_dir():
-            logger.debug(f'Downloading {parcel_polygons_file_name}...')
-            with tempfile.TemporaryDirectory() as temp_dir_name:
-                zip_file_name = f'{temp_dir_name}/{parcel_polygons_file_name}'
-                with open(zip_file_name, 'wb') as fp:
-                    ftp.retrbinary(f'RETR {parcel_polygons_file_name}', fp.write)
-                with ZipFile(zip_file_name) as zip_ref:
-                    zip_ref.extractall(output_folder)
+        ftp.voidcmd('TYPE I')  # SIZE isn't allowed in ASCII mode
+        remote = {'size': ftp.size(file_name), 'modified': ftp.voidcmd(f'MDTM {file_name}')[4:].strip()}
+        manifest = load_manifest(manifest_file_name)
 
-    logger.debug(f'Using {parcel_polygons_file_name}...')
-    return output_folder
+        if manifest.get('remote') == remote and manifest.get('complete') and os.path.isfile(output_file_name):
+            logger.debug(f'{file_name} is unchanged since it was downloaded...')
+        else:
+            # A partial download can only be resumed if it's of the same version of the file
+            if manifest.get('remote') != remote and os.path.isfile(partial_file_name):
+                os.remove(partial_file_name)
+            save_manifest({'remote': remote, 'complete': False}, manifest_file_name)
 
+            logger.debug(f'Downloading {file_name}...')
+            retrieve_with_resume(ftp, file_name, partial_file_name, remote['size'])
+            os.replace(partial_file_name, output_file_name)
+            save_manifest({'remote': remote, 'complete': True}, manifest_file_name)
 
-def log_data_frame(gdf: GeoDataFrame) -> None:
-    logger.debug(gdf.head())
+    logger.debug(f'Using {file_name}...')
+    return output_file_name
 
-    buffer = StringIO()
-    gdf.info(buf=buffer)
-    logger.debug(buffer.getvalue())
 
+# GDAL path for reading a shapefile straight out of a zip without extracting it. Only the .shp and its sidecar files
+# ever get read.
+def shapefile_in_zip(zip_file_name: str, shapefile_name: str) -> str:
+    with ZipFile(zip_file_name) as zip_ref:
+        member_name = next(name for name in zip_ref.namelist() if name.split('/')[-1] == shapefile_name)
 
-def select_keys(d: Dict, keys_to_keep: Iterable[Hashable]) -> Dict:
-    return {k: v for k, v in d.items() if k in keys_to_keep}
+    return f'/vsizip/{zip_file_name}/{member_name}'
 
 
-def features_slimmed(fiona_reader: Iterable, properties_to_keep: Iterable[str]) -> Iterable:
-    for feature in fiona_reader:
-        new_feature = feature.copy()
-        new_feature['properties'] = select_keys(new_feature['properties'], properties_to_keep)
-        yield new_feature
+@dataclass
+class ShapefileSource:
+    host: str
+    directory: str
+    match: str  # Part of the zip's file name on the FTP server
+    shapefile: str  # Name of the .shp inside the zip
+    port: int = 21
 
+    # Sources at the same location are the same zip, whichever shapefile they read from it
+    @property
+    def location(self) -> Tuple[str, str, str, int]:
+        return self.host, self.directory, self.match, self.port
 
-def load_footprints(footprint_file_name: str) -> GeoDataFrame:
-    with fiona.open(footprint_file_name) as features:
-        properties_to_keep = []  # None of the properties here are useful
-        df = GeoDataFrame.from_features(features_slimmed(features, properties_to_keep))
-        df.crs = features.crs
 
-    return remove_invalid_geometries(df.to_crs(epsg=4326))
+@dataclass
+class CountySource:
+    name: str
+    footprints: ShapefileSource
+    parcels: ShapefileSource
+    parcel_fields: Dict[str, str]  # Which fields of the parcel shapefile hold the parcel_id and year_built
 
 
-def load_parcels(parcel_file_name: str) -> GeoDataFrame:
-    with fiona.open(parcel_file_name) as features:
-        properties_to_keep = ['PARCELID', 'RESYRBLT']
-        slim_features = features_slimmed(features, properties_to_keep)  # Reduces memory usage
-        slim_features = (f for f in slim_features if f['geometry'] is not None)  # Apparently there are things in here with no shape?
-        gdf = GeoDataFrame.from_features(slim_features)
-        gdf.crs = features.crs
+def load_sources(sources_file_name: str) -> List[CountySource]:
+    with open(sources_file_name, 'r') as f:
+        config = json.load(f)
 
-    return remove_invalid_geometries(gdf.to_crs(epsg=4326))
+    return [
+        CountySource(name=county['name'], footprints=ShapefileSource(**county['footprints']),
+                     parcels=ShapefileSource(**county['parcels']), parcel_fields=county['parcel_fields'])
+        for county in config['counties']
+    ]
 
 
-def download_osu_buildings_ages(building_file_name: str, data_dir: str) -> GeoDataFrame:
-    def fetch_building_age(building_number: str) -> int:
-        response = requests.get(
-            f"https://gismaps.osu.edu/OSUDataService/OSUService.svc/BuildingDetailsExtended/{building_number}"
-        )
+def download_source(source: ShapefileSource, download_dir: str) -> str:
+    os.makedirs(download_dir, exist_ok=True)
+    return download_from_ftp(source.host, source.directory, source.match, download_dir, source.port)
+
+
+def log_data_frame(gdf: GeoDataFrame, stage: str) -> None:
+    logger.debug(gdf.head())
+
+    # Geometry memory is only the array of pointers, GEOS holds the coordinates themselves
+    memory_usage = gdf.memory_usage(index=True, deep=True)
+    columns = ', '.join(f'{column} ({gdf[column].dtype}, {memory_usage[column] / 1000000:.1f} MB)'
+                        for column in gdf.columns)
+    logger.debug(f'{stage}: {len(gdf)} rows, {memory_usage.sum() / 1000000:.1f} MB in memory: {columns} '
+                 f'(peak RSS {peak_rss_mb():.0f} MB)')
+
+
+# The only columns that make it past loading, at the narrowest types that hold them
+SCHEMA = {
+    'parcel_id': 'category',
+    'year_built': np.uint16,  # 0 for unknown, otherwise between 1776 and 2100
+}
+
+
+def apply_schema(gdf: GeoDataFrame) -> GeoDataFrame:
+    columns = [column for column in gdf.columns if column in SCHEMA]
+    return gdf[[*columns, gdf.geometry.name]].astype({column: SCHEMA[column] for column in columns})
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
 
-        build_year_group = re.search('"Date Constructed":"(\\d*)/', response.text)
-        if build_year_group is None:
-            return 0
-        else:
-            return int(build_year_group.group(1))
 
-    age_cache_file_name = f"{data_dir}/OhioState/ages.json"
+# Reads the geometries (as WKB) and only the requested columns straight into arrays, a chunk at a time, so no
+# per-feature Python objects get built for columns that would just be thrown away. Given a bbox or feature ids, only
+# those features get read.
+def read_shapefile_columns(file_name: str, columns: List[str], chunk_size: int = 100_000,
+                           bbox: Optional[Tuple[float, float, float, float]] = None,
+                           fids: Optional[np.ndarray] = None) -> GeoDataFrame:
+    start_time = time.perf_counter()
+    info = pyogrio.read_info(file_name)
 
-    if os.path.isfile(age_cache_file_name):
-        with open(age_cache_file_name, "r") as f:
-            building_ages = json.load(f)
-            logging.debug(f"Loaded {len(building_ages)} OSU building ages from cache at {age_cache_file_name}...")
+    if bbox is None and fids is None:
+        reads = [{'skip_features': offset, 'max_features': chunk_size}
+                 for offset in range(0, info['features'], chunk_size)]
     else:
-        building_ages = {}
-        with fiona.open(building_file_name) as features:
-            building_numbers = [str(feature["properties"]["BLDG_NUM"]) for feature in features]
+        reads = [{'bbox': bbox, 'fids': fids}]
+
+    geometry_chunks = []
+    column_chunks = {column: [] for column in columns}
+    for read in reads:
+        meta, _, wkbs, field_data = pyogrio.raw.read(file_name, columns=columns, **read)
+
+        # Apparently there are things in here with no shape?
+        has_geometry = np.array([wkb is not None for wkb in wkbs], dtype=bool)
+        geometry_chunks.append(shapely.from_wkb(wkbs[has_geometry]))
+        for column, values in zip(meta['fields'], field_data):
+            column_chunks[column].append(values[has_geometry])
+
+    def concatenate(chunks: List[np.ndarray]) -> np.ndarray:
+        return np.concatenate(chunks) if chunks else np.empty(0, dtype=object)
+
+    gdf = GeoDataFrame(
+        {column: concatenate(chunks) for column, chunks in column_chunks.items()},
+        geometry=concatenate(geometry_chunks), crs=info['crs']
+    )
+
+    logger.debug(f'Read {len(gdf)} of {info["features"]} features from {file_name} in '
+                 f'{time.perf_counter() - start_time:.1f}s (peak RSS {peak_rss_mb():.0f} MB)...')
+    return gdf
+
+
+WGS84 = pyproj.CRS.from_epsg(4326)
+WEB_MERCATOR = pyproj.CRS.from_epsg(3857)
+
+
+@lru_cache(maxsize=None)
+def get_transformer(source_crs: pyproj.CRS, target_crs: pyproj.CRS) -> pyproj.Transformer:
+    return pyproj.Transformer.from_crs(source_crs, target_crs, always_xy=True)
+
+
+# Transforms every coordinate of every geometry in one call to the (cached) transformer
+def reproject(gdf: GeoDataFrame, crs: Optional[pyproj.CRS]) -> GeoDataFrame:
+    if crs is None or gdf.crs == crs:
+        return gdf
+
+    transformer = get_transformer(pyproj.CRS(gdf.crs), crs)
+
+    def transform_coordinates(coordinates: np.ndarray) -> np.ndarray:
+        return np.column_stack(transformer.transform(coordinates[:, 0], coordinates[:, 1]))
+
+    geometries = shapely.transform(np.asarray(gdf.geometry.values), transform_coordinates)
+    return gdf.set_geometry(gpd.GeoSeries(geometries, index=gdf.index, crs=crs))
+
+
+# crs=None keeps the file's own CRS
+def load_footprints(footprint_file_name: str, crs: Optional[pyproj.CRS] = WGS84, workers: int = 1,
+                    fids: Optional[np.ndarray] = None) -> GeoDataFrame:
+    gdf = read_shapefile_columns(footprint_file_name, [], fids=fids)  # None of the properties here are useful
+    return repair_invalid_geometries(reproject(apply_schema(gdf), crs), workers)
+
+
+FRANKLIN_COUNTY_PARCEL_FIELDS = {'parcel_id': 'PARCELID', 'year_built': 'RESYRBLT'}
+
+
+def load_parcels(parcel_file_name: str, crs: Optional[pyproj.CRS] = WGS84, workers: int = 1,
+                 bbox: Optional[Tuple[float, float, float, float]] = None,
+                 parcel_fields: Dict[str, str] = FRANKLIN_COUNTY_PARCEL_FIELDS) -> GeoDataFrame:
+    gdf = read_shapefile_columns(parcel_file_name, [parcel_fields['parcel_id'], parcel_fields['year_built']],
+                                 bbox=bbox)
+    gdf = gdf.rename(columns={field: column for column, field in parcel_fields.items()})
+    return repair_invalid_geometries(reproject(gdf, crs), workers)
+
+
+OSU_BUILDING_DETAILS_URL = "https://gismaps.osu.edu/OSUDataService/OSUService.svc/BuildingDetailsExtended"
+
+
+# Token bucket shared by all the fetching threads
+class RateLimiter:
+    def __init__(self, requests_per_second: float, burst: int = 1):
+        self.requests_per_second = requests_per_second
+        self.burst = burst
+        self.tokens = float(burst)
+        self.last_refill = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self) -> None:
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.last_refill) * self.requests_per_second)
+                self.last_refill = now
 
-            # Not parallelized to avoid rate-limiting
-            for num in building_numbers:
-                if num != "None" and num != "0" and num != "x":
-                    building_ages[num] = fetch_building_age(num)
-                    logging.debug(f"Loaded {len(building_ages)} OSU building ages from https://gismaps.osu.edu...")
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.requests_per_second
 
-        logging.debug(f"Writing {len(building_ages)} OSU building ages to cache at {age_cache_file_name}...")
-        with open(age_cache_file_name, "w") as f:
-            json.dump(building_ages, f)
+            time.sleep(wait)
 
-    return gpd.GeoDataFrame(building_ages.items(), columns=['BLDG_NUM', 'year_built'])
 
+DATE_CONSTRUCTED_PATTERN = re.compile(r'"Date Constructed"\s*:\s*')
+WCF_DATE_PATTERN = re.compile(r'/Date\((-?\d+)')  # "\/Date(-1577905200000-0500)\/", milliseconds since 1970
+YEAR_PATTERN = re.compile(r'(?<!\d)(\d{4})(?!\d)')  # "1920/01/01", "1/1/1920", "1920-01-01T00:00:00", "1920"
 
-def load_osu_buildings(building_file_name: str, data_dir: str) -> GeoDataFrame:
+
+# Pulls the construction year out of a BuildingDetailsExtended response, counting how each response went so that
+# format changes show up in the logs instead of as a map full of undated OSU buildings. Returns the year, 0 if there
+# isn't a usable one, and the outcome.
+class BuildingAgeParser:
+    def __init__(self):
+        self.counts = Counter()
+        self.lock = threading.Lock()
+
+    def count(self, outcome: str) -> None:
+        with self.lock:
+            self.counts[outcome] += 1
+
+    def outcome(self, year: int, outcome: str) -> Tuple[int, str]:
+        self.count(outcome)
+        return year, outcome
+
+    def parse(self, response_text: str) -> Tuple[int, str]:
+        match = DATE_CONSTRUCTED_PATTERN.search(response_text)
+        if match is None:
+            return self.outcome(0, 'missing field')
+
+        # Decodes only the field's value rather than the whole response
+        try:
+            value, _ = json.JSONDecoder().raw_decode(response_text, match.end())
+        except ValueError:
+            return self.outcome(0, 'malformed')
+
+        if value is None or value == "":
+            return self.outcome(0, 'undated')
+
+        year = None
+        if isinstance(value, int):
+            year = value
+        elif isinstance(value, str):
+            wcf_date = WCF_DATE_PATTERN.search(value)
+            if wcf_date is not None:
+                year = (datetime(1970, 1, 1) + timedelta(milliseconds=int(wcf_date.group(1)))).year
+            else:
+                year_match = YEAR_PATTERN.search(value)
+                year = int(year_match.group(1)) if year_match is not None else None
+
+        if year is None or not 1776 <= year <= 2100:
+            logger.debug(f'Unrecognized "Date Constructed" value {value!r}')
+            return self.outcome(0, 'unparseable')
+
+        return self.outcome(year, 'parsed')
+
+
+def create_osu_session(concurrency: int) -> requests.Session:
+    # Only retries connecting, which never reached OSU. Anything OSU answers is retried by fetch_building_age, so that
+    # the retries go through the rate limiter too.
+    retry = Retry(total=3, connect=3, read=0, status=0, backoff_factor=1, respect_retry_after_header=False)
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=concurrency, max_retries=retry)
+
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+OSU_RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+# Honors Retry-After when OSU sends one, otherwise backs off exponentially
+def retry_delay(response: requests.Response, attempt: int, backoff_factor: float) -> float:
+    retry_after = response.headers.get("Retry-After", "")
+    return float(retry_after) if retry_after.isdigit() else backoff_factor * 2 ** attempt
+
+
+def fetch_building_age(session: requests.Session, rate_limiter: RateLimiter, parser: BuildingAgeParser,
+                       building_number: str, base_url: str = OSU_BUILDING_DETAILS_URL, retries: int = 5,
+                       backoff_factor: float = 1) -> Tuple[int, str]:
+    for attempt in range(retries + 1):
+        rate_limiter.acquire()
+        response = session.get(f"{base_url}/{building_number}", timeout=30)
+        if response.status_code not in OSU_RETRY_STATUSES or attempt == retries:
+            break
+        time.sleep(retry_delay(response, attempt, backoff_factor))
+
+    response.raise_for_status()
+    return parser.parse(response.text)
+
+
+# Fetches over a pool of kept-alive connections, with the rate limiter keeping the total request rate under what OSU
+# tolerates no matter how many requests are in flight. Yields (building number, age, outcome, error) as each fetch
+# finishes, where only failing to get a response at all is an error.
+def fetch_osu_building_ages(building_numbers: List[str], parser: BuildingAgeParser,
+                            base_url: str = OSU_BUILDING_DETAILS_URL, concurrency: int = 4,
+                            requests_per_second: float = 4, backoff_factor: float = 1
+                            ) -> Iterator[Tuple[str, Optional[int], Optional[str], Optional[Exception]]]:
+    rate_limiter = RateLimiter(requests_per_second)
+
+    with create_osu_session(concurrency) as session, ThreadPoolExecutor(concurrency) as executor:
+        futures = {
+            executor.submit(fetch_building_age, session, rate_limiter, parser, num, base_url,
+                            backoff_factor=backoff_factor): num
+            for num in building_numbers
+        }
+        for future in as_completed(futures):
+            try:
+                age, outcome = future.result()
+                yield futures[future], age, outcome, None
+            except requests.RequestException as e:
+                yield futures[future], None, None, e
+
+
+def open_osu_age_cache(cache_file_name: str, legacy_cache_file_name: str) -> sqlite3.Connection:
+    connection = sqlite3.connect(cache_file_name)
+    connection.executescript("""
+        CREATE TABLE IF NOT EXISTS ages (
+            building_number TEXT PRIMARY KEY, year_built INTEGER, fetched_at REAL, outcome TEXT
+        );
+        CREATE TABLE IF NOT EXISTS failures (
+            building_number TEXT PRIMARY KEY, error TEXT, failed_at REAL, attempts INTEGER
+        );
+    """)
+
+    # Caches from before the parser's outcome was kept
+    if "outcome" not in {column for _, column, *_ in connection.execute("PRAGMA table_info(ages)")}:
+        connection.execute("ALTER TABLE ages ADD COLUMN outcome TEXT")
+
+    # Carry over the ages cached by the old all-or-nothing JSON cache
+    is_empty = connection.execute("SELECT COUNT(*) FROM ages").fetchone()[0] == 0
+    if is_empty and os.path.isfile(legacy_cache_file_name):
+        with open(legacy_cache_file_name, "r") as f:
+            legacy_ages = json.load(f)
+        fetched_at = os.path.getmtime(legacy_cache_file_name)
+        connection.executemany("INSERT INTO ages VALUES (?, ?, ?, ?)",
+                               [(num, age, fetched_at, "imported") for num, age in legacy_ages.items()])
+        connection.commit()
+        logging.debug(f"Imported {len(legacy_ages)} OSU building ages from {legacy_cache_file_name}...")
+
+    return connection
+
+
+OSU_FAILURE_BACKOFF_HOURS = 1  # Doubled after every failed attempt
+OSU_MAX_FETCH_ATTEMPTS = 5
+
+
+# Whether a building number that failed to fetch is due another try. Numbers that keep failing (like a 404 for a
+# stale BLDG_NUM) back off exponentially, and once they're over the attempt limit are only retried as often as a cached
+# age expires.
+def osu_fetch_retry_due(failed_at: float, attempts: int, now: float, expired_before: float) -> bool:
+    if attempts >= OSU_MAX_FETCH_ATTEMPTS:
+        return failed_at < expired_before
+    return failed_at + OSU_FAILURE_BACKOFF_HOURS * 60 * 60 * 2 ** (attempts - 1) <= now
+
+
+# Only fetches building numbers that aren't cached or whose cached age is older than cache_days. Every result is
+# committed as soon as it arrives, so a crash midway keeps what was already fetched, and failures are kept separately
+# so they get retried on a later run. Buildings without an age, like the ones that failed, get 0 like undated ones.
+def download_osu_buildings_ages(building_numbers: Iterable, data_dir: str, concurrency: int = 4,
+                                requests_per_second: float = 4, cache_days: float = 90) -> GeoDataFrame:
+    building_numbers = [num for num in dict.fromkeys(str(num) for num in building_numbers)
+                        if num != "None" and num != "0" and num != "x"]
+
+    connection = open_osu_age_cache(f"{data_dir}/OhioState/ages.sqlite", f"{data_dir}/OhioState/ages.json")
+
+    now = time.time()
+    expired_before = now - cache_days * 24 * 60 * 60
+    fresh_building_numbers = {
+        num for (num,)
+        in connection.execute("SELECT building_number FROM ages WHERE fetched_at >= ?", (expired_before,))
+    }
+    backing_off_building_numbers = {
+        num for num, failed_at, attempts
+        in connection.execute("SELECT building_number, failed_at, attempts FROM failures")
+        if not osu_fetch_retry_due(failed_at, attempts, now, expired_before)
+    }
+    missing_building_numbers = [num for num in building_numbers
+                                if num not in fresh_building_numbers and num not in backing_off_building_numbers]
+    logging.debug(f"{len(building_numbers) - len(missing_building_numbers)} OSU building ages are cached or failed "
+                  f"recently, fetching {len(missing_building_numbers)}...")
+
+    if missing_building_numbers:
+        parser = BuildingAgeParser()
+        fetched = failed = 0
+        for num, age, outcome, error in fetch_osu_building_ages(missing_building_numbers, parser,
+                                                                concurrency=concurrency,
+                                                                requests_per_second=requests_per_second):
+            # Responses without a usable year are cached like any other, refetching won't change them
+            if error is None:
+                connection.execute("INSERT OR REPLACE INTO ages VALUES (?, ?, ?, ?)",
+                                   (num, age, time.time(), outcome))
+                connection.execute("DELETE FROM failures WHERE building_number = ?", (num,))
+                fetched += 1
+            else:
+                connection.execute("""
+                    INSERT INTO failures VALUES (?, ?, ?, 1)
+                    ON CONFLICT (building_number) DO UPDATE
+                    SET error = excluded.error, failed_at = excluded.failed_at, attempts = attempts + 1
+                """, (num, repr(error), time.time()))
+                failed += 1
+            connection.commit()
+
+            if (fetched + failed) % 100 == 0:
+                logging.debug(f"Fetched {fetched} OSU building ages ({failed} failed)...")
+
+        logging.debug(f"Fetched {fetched} OSU building ages, {failed} failed and will be retried after backing off...")
+        logging.debug(f"OSU building age responses: {dict(parser.counts)}")
+
+    building_ages = pd.DataFrame(connection.execute("SELECT building_number, year_built FROM ages").fetchall(),
+                                 columns=["BLDG_NUM", "year_built"])
+    connection.close()
+
+    building_ages = pd.DataFrame({"BLDG_NUM": building_numbers}).merge(building_ages, on="BLDG_NUM", how="left")
+    return gpd.GeoDataFrame(building_ages.fillna({"year_built": 0}))
+
+
+def load_osu_buildings(building_file_name: str, data_dir: str, concurrency: int = 4,
+                       requests_per_second: float = 4, cache_days: float = 90) -> GeoDataFrame:
     # TODO find a way to download this file
-    with fiona.open(building_file_name) as features:
-        gdf = GeoDataFrame.from_features(features)
-        gdf.crs = features.crs
+    gdf = read_shapefile_columns(building_file_name, ['BLDG_NUM'])
 
-    building_ages = download_osu_buildings_ages(building_file_name, data_dir)
+    building_ages = download_osu_buildings_ages(gdf['BLDG_NUM'], data_dir, concurrency, requests_per_second,
+                                                cache_days)
     gdf = gdf.merge(building_ages, on='BLDG_NUM')
-    gdf = gdf[['geometry', 'year_built']]  # Remove all the columns we don't need
-
-    return remove_invalid_geometries(gdf.to_crs(epsg=4326))
 
+    return repair_invalid_geometries(reproject(apply_schema(gdf), WGS84))
 
-def remove_invalid_geometries(gdf: GeoDataFrame) -> GeoDataFrame:
-    return gdf[gdf.geometry.is_valid]
 
+def repair_geometries(geometries: np.ndarray) -> np.ndarray:
+    repaired = shapely.make_valid(geometries)
 
-def contains_letters(s: str) -> bool:
-    return any(c.isalpha() for c in s)
+    # Repairing can split a shape into polygons plus stray lines or points, only the polygons are part of the building
+    for position in np.flatnonzero(~np.isin(shapely.get_type_id(repaired), [3, 6])):
+        parts = shapely.get_parts(shapely.get_parts(repaired[position]))
+        polygons = parts[shapely.get_type_id(parts) == 3]
+        if len(polygons) == 0:
+            repaired[position] = None
+        elif len(polygons) == 1:
+            repaired[position] = polygons[0]
+        else:
+            repaired[position] = shapely.multipolygons(polygons)
 
+    return repaired
 
-def sane_year_built(year: int) -> bool:
-    return 1776 <= int(year) <= 2027
 
+# Repairs invalid geometries rather than dropping the buildings, only dropping the ones with nothing left after repair.
+# Checking validity is cheap, so only the invalid geometries get sent to the process pool.
+def repair_invalid_geometries(gdf: GeoDataFrame, workers: int = 1, chunk_size: int = 10_000) -> GeoDataFrame:
+    geometries = np.asarray(gdf.geometry.values).copy()
+    invalid_positions = np.flatnonzero(~shapely.is_valid(geometries))
+    chunks = [invalid_positions[start:start + chunk_size] for start in range(0, len(invalid_positions), chunk_size)]
 
-def clean_parcel_id(s: str) -> str:
-    if s[-3:] == '-00':
-        return s[:-3].strip().replace('-', '')
+    if workers > 1 and len(chunks) > 1:
+        with ProcessPoolExecutor(workers) as executor:
+            repaired_chunks = list(executor.map(repair_geometries, [geometries[chunk] for chunk in chunks]))
     else:
-        return s.strip().replace('-', '')
+        repaired_chunks = [repair_geometries(geometries[chunk]) for chunk in chunks]
+
+    for chunk, repaired_chunk in zip(chunks, repaired_chunks):
+        geometries[chunk] = repaired_chunk
+
+    dropped = shapely.is_missing(geometries) | shapely.is_empty(geometries)
+    dropped_count = np.count_nonzero(dropped)
+    logger.debug(f'{len(geometries) - len(invalid_positions)} valid geometries, '
+                 f'{len(invalid_positions) - dropped_count} repaired, {dropped_count} dropped...')
+
+    repaired_gdf = gdf.set_geometry(gpd.GeoSeries(geometries, index=gdf.index, crs=gdf.crs))
+    return repaired_gdf[~dropped]
+
+
+def contains_letters(s: pd.Series) -> pd.Series:
+    # Letters are the word characters that aren't digits or underscores
+    return s.str.contains(r'[^\W\d_]', regex=True)
+
+
+def sane_year_built(years: pd.Series) -> pd.Series:
+    # Truncates like int() does, and like int() fails on missing years
+    return pd.to_numeric(years).astype(np.int64).between(1776, 2027)
+
+
+def clean_parcel_id(s: pd.Series) -> pd.Series:
+    # The suffix is only dropped if it's at the very end, before any whitespace gets stripped
+    return s.str.replace(r'-00\Z', '', regex=True).str.strip().str.replace('-', '', regex=False)
 
 
 def clean_parcel_data_frame(gdf: GeoDataFrame) -> GeoDataFrame:
-    new_gdf = gdf.rename(columns={'PARCELID': 'parcel_id', 'RESYRBLT': 'year_built'})
+    new_gdf = gdf[~contains_letters(gdf.parcel_id)]
+    new_gdf = new_gdf.assign(parcel_id=clean_parcel_id(new_gdf.parcel_id))
+    new_gdf = new_gdf[sane_year_built(new_gdf.year_built)]
 
-    new_gdf = new_gdf[~new_gdf.parcel_id.apply(contains_letters)]
-    new_gdf.parcel_id = new_gdf.parcel_id.apply(clean_parcel_id)
-    new_gdf = new_gdf[new_gdf.year_built.apply(sane_year_built)]
+    # From here on a parcel is identified by its position, the id is only kept (as a categorical) for the join store
+    new_gdf = new_gdf.assign(year_built=pd.to_numeric(new_gdf.year_built).astype(np.int64))
+    return apply_schema(new_gdf).reset_index(drop=True)
 
-    return new_gdf
 
+# Grouped argmax: for each footprint, the parcel with the highest score, ties going to the lowest parcel position
+def best_parcel_per_footprint(footprint_count: int, footprint_positions: np.ndarray, parcel_positions: np.ndarray,
+                              scores: np.ndarray) -> np.ndarray:
+    order = np.lexsort((parcel_positions, -scores, footprint_positions))
+    matched_footprints, first_pairs = np.unique(footprint_positions[order], return_index=True)
 
-# This is really slow but it works great
-def join_footprints_parcels(footprints: GeoDataFrame, parcels: GeoDataFrame) -> GeoDataFrame:
-    parcels_sindex = parcels.sindex
+    corresponding_parcels = np.full(footprint_count, -1, dtype=np.int64)
+    corresponding_parcels[matched_footprints] = parcel_positions[order][first_pairs]
+    return corresponding_parcels
 
-    corresponding_parcel_ids = []
-    for index, row in footprints.iterrows():
-        footprint = row['geometry']
 
-        nearby_parcels_indexes = list(parcels_sindex.intersection(footprint.bounds))
-        nearby_parcels = parcels.iloc[nearby_parcels_indexes]
+def match_footprints_to_parcels_by_overlap(footprint_geometries: np.ndarray, parcel_geometries: np.ndarray,
+                                           parcels_tree: shapely.STRtree) -> np.ndarray:
+    footprint_positions, parcel_positions = parcels_tree.query(footprint_geometries)
+
+    intersection_areas = shapely.area(shapely.intersection(
+        footprint_geometries[footprint_positions], parcel_geometries[parcel_positions]
+    ))
+    intersection_ratios = intersection_areas / shapely.area(footprint_geometries[footprint_positions])
+
+    # Footprints that only touch their candidates' bounding boxes don't get a parcel
+    overlapping = intersection_ratios > 0
+    return best_parcel_per_footprint(len(footprint_geometries), footprint_positions[overlapping],
+                                     parcel_positions[overlapping], intersection_ratios[overlapping])
+
+
+# Returns, for each footprint, the position of the parcel it overlaps the most, or -1 if it overlaps none
+def match_footprints_to_parcels(footprint_geometries: np.ndarray, parcel_geometries: np.ndarray) -> np.ndarray:
+    shapely.prepare(parcel_geometries)
+    parcels_tree = shapely.STRtree(parcel_geometries)
+
+    # Most footprints sit entirely inside a parcel, which settles it without building any intersections. A footprint
+    # inside more than one (stacked condo parcels) overlaps them all fully, so the lowest position wins like a tie.
+    footprint_positions, parcel_positions = parcels_tree.query(footprint_geometries, predicate='within')
+    corresponding_parcels = best_parcel_per_footprint(len(footprint_geometries), footprint_positions,
+                                                      parcel_positions, np.ones(len(footprint_positions)))
+
+    # Only the footprints straddling parcel lines have their overlaps measured
+    straddling = np.flatnonzero(corresponding_parcels < 0)
+    corresponding_parcels[straddling] = match_footprints_to_parcels_by_overlap(
+        footprint_geometries[straddling], parcel_geometries, parcels_tree
+    )
+
+    logger.debug(f'{len(footprint_geometries) - len(straddling)} footprints were inside a parcel, '
+                 f'{len(straddling)} were matched by overlap...')
+    return corresponding_parcels
+
+
+# Faster, approximate alternative to match_footprints_to_parcels for very large extracts: a footprint goes to the
+# parcel containing a point guaranteed to be inside it. Only footprints whose point isn't inside exactly one parcel
+# (on a parcel line, in stacked parcels, or outside every parcel) fall back to the exact rule.
+def match_footprints_to_parcels_by_point(footprint_geometries: np.ndarray, parcel_geometries: np.ndarray) -> np.ndarray:
+    shapely.prepare(parcel_geometries)
+    representative_points = shapely.point_on_surface(footprint_geometries)
+    point_positions, parcel_positions = shapely.STRtree(parcel_geometries).query(representative_points,
+                                                                               predicate='within')
+
+    containing_parcel_counts = np.bincount(point_positions, minlength=len(footprint_geometries))
+    unambiguous = containing_parcel_counts[point_positions] == 1
+    corresponding_parcels = np.full(len(footprint_geometries), -1, dtype=np.int64)
+    corresponding_parcels[point_positions[unambiguous]] = parcel_positions[unambiguous]
+
+    ambiguous = np.flatnonzero(containing_parcel_counts != 1)
+    corresponding_parcels[ambiguous] = match_footprints_to_parcels(footprint_geometries[ambiguous], parcel_geometries)
+
+    logger.debug(f'{len(footprint_geometries) - len(ambiguous)} footprints were matched by a representative point, '
+                 f'{len(ambiguous)} were ambiguous...')
+    return corresponding_parcels
+
+
+JOIN_MODES = {
+    'exact': match_footprints_to_parcels,
+    'point': match_footprints_to_parcels_by_point,
+}
+
+
+# Runs both join modes on a sample of the footprints to measure how often the point join gets a different answer
+def compare_join_modes(footprint_geometries: np.ndarray, parcel_geometries: np.ndarray, sample_size: int,
+                       seed: int = 0) -> Dict:
+    rng = np.random.default_rng(seed)
+    sample = np.sort(rng.choice(len(footprint_geometries), min(sample_size, len(footprint_geometries)), replace=False))
+
+    exact = match_footprints_to_parcels(footprint_geometries[sample], parcel_geometries)
+    by_point = match_footprints_to_parcels_by_point(footprint_geometries[sample], parcel_geometries)
+    differing = int(np.count_nonzero(exact != by_point))
+
+    logger.info(f'The point join differs from the exact join for {differing} of {len(sample)} sampled footprints '
+                f'({100 * differing / max(len(sample), 1):.2f}%)')
+    return {'sampled': len(sample), 'differing': differing}
+
+
+# Splits footprints into spatially compact tiles of at most max_footprints_per_tile footprints each by recursively
+# cutting the longer side of each tile at its median footprint
+def partition_footprints(footprint_geometries: np.ndarray, max_footprints_per_tile: int) -> List[np.ndarray]:
+    bounds = shapely.bounds(footprint_geometries)
+    return partition_footprint_bounds(bounds, max_footprints_per_tile)
+
+
+def partition_footprint_bounds(bounds: np.ndarray, max_footprints_per_tile: int) -> List[np.ndarray]:
+    centers = np.column_stack(((bounds[:, 0] + bounds[:, 2]) / 2, (bounds[:, 1] + bounds[:, 3]) / 2))
+
+    tiles = []
+    pending = [np.arange(len(bounds))]
+    while pending:
+        positions = pending.pop()
+        if len(positions) <= max_footprints_per_tile:
+            tiles.append(np.sort(positions))
+            continue
+
+        tile_centers = centers[positions]
+        axis = np.argmax(tile_centers.max(axis=0) - tile_centers.min(axis=0))
+        middle = len(positions) // 2
+        split = np.argpartition(tile_centers[:, axis], middle)
+        pending.append(positions[split[:middle]])
+        pending.append(positions[split[middle:]])
+
+    return sorted(tiles, key=lambda tile: tile[0])
+
+
+def match_footprints_to_parcels_parallel(footprint_geometries: np.ndarray, parcel_geometries: np.ndarray,
+                                         workers: int, join_mode: str = 'exact') -> np.ndarray:
+    match = JOIN_MODES[join_mode]
+    if workers <= 1 or len(footprint_geometries) == 0:
+        return match(footprint_geometries, parcel_geometries)
+
+    # A few tiles per worker keeps the pool busy when some parts of the county are denser than others
+    tiles = partition_footprints(footprint_geometries, math.ceil(len(footprint_geometries) / (workers * 4)))
+    parcels_tree = shapely.STRtree(parcel_geometries)
+
+    corresponding_parcels = np.full(len(footprint_geometries), -1, dtype=np.int64)
+    with ProcessPoolExecutor(workers) as executor:
+        jobs = []
+        for tile in tiles:
+            # Every candidate of a footprint in this tile overlaps the tile's bounds. Keeping the parcels in their
+            # original order means ties resolve the same way as in a single process join.
+            tile_bounds = shapely.box(*shapely.total_bounds(footprint_geometries[tile]))
+            tile_parcels = np.sort(parcels_tree.query(tile_bounds))
+            future = executor.submit(match, footprint_geometries[tile], parcel_geometries[tile_parcels])
+            jobs.append((tile, tile_parcels, future))
+
+        for tile, tile_parcels, future in jobs:
+            tile_corresponding_parcels = future.result()
+            matched = tile_corresponding_parcels >= 0
+            corresponding_parcels[tile[matched]] = tile_parcels[tile_corresponding_parcels[matched]]
+
+    logger.debug(f'Joined {len(footprint_geometries)} footprints in {len(tiles)} tiles across {workers} workers...')
+    return corresponding_parcels
+
+
+def geometry_hashes(geometries: np.ndarray, prefixes: Optional[Iterable[str]] = None) -> np.ndarray:
+    wkbs = shapely.to_wkb(geometries)
+    if prefixes is None:
+        return np.array([hashlib.sha1(wkb).hexdigest() for wkb in wkbs], dtype=object)
+    else:
+        return np.array([hashlib.sha1(prefix.encode() + wkb).hexdigest() for prefix, wkb in zip(prefixes, wkbs)],
+                        dtype=object)
 
-        if len(nearby_parcels) == 0:
-            corresponding_parcel_ids.append(None)
-        else:
-            footprint_area = footprint.area
 
-            intersection_ratios = [footprint.intersection(parcel).area / footprint_area for parcel in nearby_parcels['geometry']]
-            if all(ratio == 0 for ratio in intersection_ratios):
-                corresponding_parcel_ids.append(None)
+def load_join_store(store_file_name: str) -> Dict:
+    if os.path.isfile(store_file_name):
+        with open(store_file_name, 'r') as f:
+            store = json.load(f)
+            logger.debug(f'Loaded {len(store["footprints"])} previous join results from {store_file_name}...')
+            return store
+    else:
+        return {'footprints': {}, 'parcels': []}
+
+
+def save_join_store(store: Dict, store_file_name: str) -> None:
+    # Written to the side first so a crash mid-write doesn't leave a corrupted store behind
+    with open(f'{store_file_name}.tmp', 'w') as f:
+        json.dump(store, f)
+    os.replace(f'{store_file_name}.tmp', store_file_name)
+    logger.debug(f'Wrote {len(store["footprints"])} join results to {store_file_name}...')
+
+
+# Like match_footprints_to_parcels_parallel, but only re-joins the footprints whose result could have changed since
+# the run that wrote the store: new or changed footprints, footprints whose parcel changed or disappeared, and
+# footprints touching new or changed parcels
+def match_footprints_to_parcels_incremental(footprint_geometries: np.ndarray, parcel_geometries: np.ndarray,
+                                            parcel_ids: np.ndarray, store_file_name: str, workers: int,
+                                            join_mode: str = 'exact') -> np.ndarray:
+    footprint_hashes = geometry_hashes(footprint_geometries)
+    parcel_hashes = geometry_hashes(parcel_geometries, prefixes=(str(parcel_id) for parcel_id in parcel_ids))
+
+    parcel_positions_by_hash = {}
+    for position, parcel_hash in enumerate(parcel_hashes):
+        parcel_positions_by_hash.setdefault(parcel_hash, position)
+
+    store = load_join_store(store_file_name)
+    previous_parcel_hashes = set(store['parcels'])
+
+    corresponding_parcels = np.full(len(footprint_geometries), -1, dtype=np.int64)
+    needs_join = np.zeros(len(footprint_geometries), dtype=bool)
+    for position, footprint_hash in enumerate(footprint_hashes):
+        previous_result = store['footprints'].get(footprint_hash)
+        if previous_result is None:
+            needs_join[position] = True
+        elif previous_result[1] is not None:
+            parcel_position = parcel_positions_by_hash.get(previous_result[1])
+            if parcel_position is None:
+                needs_join[position] = True
             else:
-                corresponding_parcel_index = max(zip(nearby_parcels_indexes, intersection_ratios), key=lambda x: x[1])[0]
-                corresponding_parcel_ids.append(parcels.iloc[corresponding_parcel_index]['parcel_id'])
+                corresponding_parcels[position] = parcel_position
+
+    changed_parcels = np.array([parcel_hash not in previous_parcel_hashes for parcel_hash in parcel_hashes], dtype=bool)
+    if changed_parcels.any():
+        _, touching_footprints = shapely.STRtree(footprint_geometries).query(parcel_geometries[changed_parcels])
+        needs_join[touching_footprints] = True
+
+    logger.debug(f'Re-joining {np.count_nonzero(needs_join)} of {len(footprint_geometries)} footprints '
+                 f'({np.count_nonzero(changed_parcels)} new or changed parcels)...')
+    corresponding_parcels[needs_join] = match_footprints_to_parcels_parallel(
+        footprint_geometries[needs_join], parcel_geometries, workers, join_mode
+    )
+
+    matched = corresponding_parcels >= 0
+    matched_parcel_ids = np.full(len(footprint_geometries), None, dtype=object)
+    matched_parcel_ids[matched] = [str(parcel_id) for parcel_id in parcel_ids[corresponding_parcels[matched]]]
+    matched_parcel_hashes = np.full(len(footprint_geometries), None, dtype=object)
+    matched_parcel_hashes[matched] = parcel_hashes[corresponding_parcels[matched]]
+
+    save_join_store({
+        'footprints': {
+            footprint_hash: [parcel_id, parcel_hash]
+            for footprint_hash, parcel_id, parcel_hash in zip(footprint_hashes, matched_parcel_ids, matched_parcel_hashes)
+        },
+        'parcels': list(parcel_positions_by_hash.keys())
+    }, store_file_name)
+
+    return corresponding_parcels
+
+
+def join_footprints_parcels(footprints: GeoDataFrame, parcels: GeoDataFrame, workers: int = 1,
+                            store_file_name: Optional[str] = None, join_mode: str = 'exact') -> GeoDataFrame:
+    footprint_geometries = np.asarray(footprints.geometry.values)
+    parcel_geometries = np.asarray(parcels.geometry.values)
+    if store_file_name is None:
+        corresponding_parcels = match_footprints_to_parcels_parallel(footprint_geometries, parcel_geometries, workers,
+                                                                     join_mode)
+    else:
+        corresponding_parcels = match_footprints_to_parcels_incremental(
+            footprint_geometries, parcel_geometries, parcels['parcel_id'].to_numpy(), store_file_name, workers,
+            join_mode
+        )
 
-        if len(corresponding_parcel_ids) % 1000 == 0:
-            logger.debug(f'Join progress: {len(corresponding_parcel_ids)}')
+    matched = corresponding_parcels >= 0
+    logger.debug(f'Matched {np.count_nonzero(matched)} of {len(footprints)} footprints to parcels...')
 
-    footprints['parcel_id'] = corresponding_parcel_ids
-    merged = footprints.merge(parcels, on='parcel_id', how='left')
-    merged = merged.rename(columns={'geometry_x': 'geometry'})
-    merged = gpd.GeoDataFrame(merged[['geometry', 'year_built']])
-    return merged.fillna(0)
+    # Parcels are identified by position, so the year comes straight out of the parcel array
+    years_built = np.zeros(len(footprints), dtype=parcels['year_built'].dtype)
+    years_built[matched] = parcels['year_built'].to_numpy().take(corresponding_parcels[matched])
+
+    return GeoDataFrame({'year_built': years_built}, geometry=footprint_geometries, crs=footprints.crs)
 
 
 def concat(*dataframes: GeoDataFrame) -> GeoDataFrame:
@@ -230,65 +873,580 @@ def sort_by_render_priority(gdf: GeoDataFrame) -> GeoDataFrame:
     return concat(dated.sort_values('year_built'), undated)
 
 
-# TODO add buffer so nearly intersecting buildings also get filtered
-# TODO is this actually needed since we have the new join method?
-def filter_intersecting_buildings(gdf: GeoDataFrame) -> GeoDataFrame:
-    sorted_gdf = sort_by_render_priority(gdf)
+# Drops buildings that overlap a higher priority building by at least iou_threshold (intersection over union).
+# Expects the frame to already be in render priority order.
+def suppress_overlapping_buildings(gdf: GeoDataFrame, iou_threshold: float) -> GeoDataFrame:
+    geometries = np.asarray(gdf.geometry.values)
+    winners, losers = shapely.STRtree(geometries).query(geometries, predicate='intersects')
 
-    sorted_gdf['wkt'] = sorted_gdf['geometry'].apply(lambda x: str(x))
-    filtered_gdf = sorted_gdf.dissolve(by='wkt', aggfunc='first')
+    # Every overlapping pair shows up twice, so only look at it from the side of the higher priority building
+    candidates = winners < losers
+    winners, losers = winners[candidates], losers[candidates]
 
-    return filtered_gdf
+    intersection_areas = shapely.area(shapely.intersection(geometries[winners], geometries[losers]))
+    union_areas = shapely.area(geometries[winners]) + shapely.area(geometries[losers]) - intersection_areas
+    # Strictly above, so even a threshold of 0 leaves buildings that only share a wall alone
+    overlapping = (union_areas > 0) & (intersection_areas > iou_threshold * union_areas)
+    winners, losers = winners[overlapping], losers[overlapping]
 
+    # A building can only suppress others if it wasn't suppressed itself. Going through the pairs in order of the
+    # losing building means the fate of every winner is settled before it gets used.
+    suppressed = np.zeros(len(geometries), dtype=bool)
+    for pair in np.lexsort((winners, losers)):
+        if not suppressed[winners[pair]]:
+            suppressed[losers[pair]] = True
 
-def main():
-    data_dir = './data'
-    os.makedirs(data_dir, exist_ok=True)
-
-    # Download in parallel
-    with ThreadPoolExecutor(3) as executor:
-        future_osu_buildings = executor.submit(load_osu_buildings, f'{data_dir}/OhioState/data.gdb', data_dir)
-        future_footprint_dir_name = executor.submit(download_franklin_county_building_footprints, data_dir)
-        future_parcels_dir_name = executor.submit(download_franklin_county_parcel_polygons, data_dir)
+    logger.debug(f'Suppressed {np.count_nonzero(suppressed)} buildings overlapping higher priority buildings...')
+    return gdf[~suppressed].reset_index(drop=True)
 
-        timeout = 300
-        osu_buildings = future_osu_buildings.result(timeout)
-        footprint_dir_name = future_footprint_dir_name.result(timeout)
-        parcels_dir_name = future_parcels_dir_name.result(timeout)
 
-    logger.info('Downloaded data...')
-    log_data_frame(osu_buildings)
+# TODO is this actually needed since we have the new join method?
+def filter_intersecting_buildings(gdf: GeoDataFrame, iou_threshold: float = 0.8) -> GeoDataFrame:
+    sorted_gdf = sort_by_render_priority(gdf)
 
-    footprint_file_name = f'{footprint_dir_name}/BUILDINGFOOTPRINT.shp'
-    parcels_file_name = f'{parcels_dir_name}/TAXPARCEL_CONDOUNITSTACK_LGIM.shp'
+    # Normalizing first means the same shape drawn from a different starting vertex or in the other direction still
+    # counts as a duplicate. Keeping the first of each makes the building with the highest render priority win.
+    normalized_wkbs = pd.Series(shapely.to_wkb(shapely.normalize(np.asarray(sorted_gdf.geometry.values))))
+    filtered_gdf = sorted_gdf[~normalized_wkbs.duplicated(keep='first').values].reset_index(drop=True)
 
-    footprints = load_footprints(footprint_file_name)
-    log_data_frame(footprints)
+    return suppress_overlapping_buildings(filtered_gdf, iou_threshold)
 
-    parcels = clean_parcel_data_frame(load_parcels(parcels_file_name))
-    log_data_frame(parcels)
 
-    logger.info('Loaded data...')
+def geojson_feature_lines(gdf: GeoDataFrame, chunk_size: int = 10_000) -> Iterator[str]:
+    for start in range(0, len(gdf), chunk_size):
+        chunk = gdf.iloc[start:start + chunk_size]
+        geometries = shapely.to_geojson(np.asarray(chunk.geometry.values))
+        for geometry, year_built in zip(geometries, chunk['year_built'].values):
+            yield f'{{"type":"Feature","properties":{{"year_built":{int(year_built)}}},"geometry":{geometry}}}\n'
+
+
+# Pipes newline-delimited GeoJSON straight into tippecanoe, which tiles while the rest is still being serialized
+def write_tiles_streaming(gdf: GeoDataFrame, mbtiles_file_name: str) -> None:
+    with subprocess.Popen(['bash', 'tippecanoe_cmd.sh', mbtiles_file_name], stdin=subprocess.PIPE,
+                          stderr=sys.stderr, stdout=sys.stdout, text=True) as tippecanoe:
+        tippecanoe.stdin.writelines(geojson_feature_lines(gdf))
+        tippecanoe.stdin.close()
+
+    if tippecanoe.returncode != 0:
+        raise subprocess.CalledProcessError(tippecanoe.returncode, tippecanoe.args)
+
+
+# Same zoom range tippecanoe_cmd.sh builds
+MIN_ZOOM = 11
+MAX_ZOOM = 15
+
+WEB_MERCATOR_HALF_WIDTH = 20037508.342789244
+TILE_EXTENT = 4096
+TILE_BUFFER = 80  # In tile pixels, tippecanoe's default --buffer of 5 is in 1/256ths of a tile
+
+
+def web_mercator_tile_size(zoom: int) -> float:
+    return 2 * WEB_MERCATOR_HALF_WIDTH / 2 ** zoom
+
+
+def web_mercator_tile_bounds(zoom: int, x: int, y: int) -> Tuple[float, float, float, float]:
+    tile_size = web_mercator_tile_size(zoom)
+    min_x = x * tile_size - WEB_MERCATOR_HALF_WIDTH
+    max_y = WEB_MERCATOR_HALF_WIDTH - y * tile_size
+    return min_x, max_y - tile_size, min_x + tile_size, max_y
+
+
+def encode_tile(zoom: int, x: int, y: int, geometries: np.ndarray, years_built: np.ndarray,
+                simplification_pixels: float) -> Tuple[int, int, int, bytes]:
+    tile_bounds = web_mercator_tile_bounds(zoom, x, y)
+    pixel_size = web_mercator_tile_size(zoom) / TILE_EXTENT
+    buffer = TILE_BUFFER * pixel_size
+
+    geometries = shapely.clip_by_rect(geometries, tile_bounds[0] - buffer, tile_bounds[1] - buffer,
+                                      tile_bounds[2] + buffer, tile_bounds[3] + buffer)
+    if simplification_pixels > 0:
+        geometries = shapely.simplify(geometries, simplification_pixels * pixel_size, preserve_topology=True)
+
+    # Clipping can leave nothing, or slivers that are no longer polygons
+    is_polygon = np.isin(shapely.get_type_id(geometries), [3, 6]) & ~shapely.is_empty(geometries)
+    features = [
+        {'geometry': geometry, 'properties': {'year_built': int(year_built)}}
+        for geometry, year_built in zip(geometries[is_polygon], years_built[is_polygon])
+    ]
+
+    tile_data = mapbox_vector_tile.encode(
+        [{'name': 'buildings', 'features': features}],
+        default_options={'quantize_bounds': tile_bounds, 'extents': TILE_EXTENT}
+    )
+    # mtime=0 keeps identical tiles byte-for-byte identical so they can be deduplicated
+    return zoom, x, y, gzip.compress(tile_data, mtime=0)
+
+
+def tiles_for_zoom(geometries: np.ndarray, zoom: int) -> Iterator[Tuple[int, int, np.ndarray]]:
+    tile_size = web_mercator_tile_size(zoom)
+    buffer = TILE_BUFFER * tile_size / TILE_EXTENT
+    bounds = shapely.bounds(geometries)
+
+    min_x = np.floor((bounds[:, 0] - buffer + WEB_MERCATOR_HALF_WIDTH) / tile_size).astype(np.int64)
+    max_x = np.floor((bounds[:, 2] + buffer + WEB_MERCATOR_HALF_WIDTH) / tile_size).astype(np.int64)
+    min_y = np.floor((WEB_MERCATOR_HALF_WIDTH - bounds[:, 3] - buffer) / tile_size).astype(np.int64)
+    max_y = np.floor((WEB_MERCATOR_HALF_WIDTH - bounds[:, 1] + buffer) / tile_size).astype(np.int64)
+
+    # One (tile, feature) pair for every tile each feature's buffered bounds touch
+    spans_x = max_x - min_x + 1
+    pair_counts = spans_x * (max_y - min_y + 1)
+    feature_positions = np.repeat(np.arange(len(geometries)), pair_counts)
+    offsets = np.arange(pair_counts.sum()) - np.repeat(np.cumsum(pair_counts) - pair_counts, pair_counts)
+    tile_xs = min_x[feature_positions] + offsets % spans_x[feature_positions]
+    tile_ys = min_y[feature_positions] + offsets // spans_x[feature_positions]
+
+    # Features stay in render priority order within each tile
+    order = np.lexsort((feature_positions, tile_ys, tile_xs))
+    feature_positions, tile_xs, tile_ys = feature_positions[order], tile_xs[order], tile_ys[order]
+    tile_starts = np.flatnonzero(np.diff(tile_xs, prepend=-1) | np.diff(tile_ys, prepend=-1))
+    for start, end in zip(tile_starts, np.append(tile_starts[1:], len(order))):
+        yield tile_xs[start], tile_ys[start], feature_positions[start:end]
+
+
+def create_mbtiles(mbtiles_file_name: str) -> sqlite3.Connection:
+    if os.path.isfile(mbtiles_file_name):
+        os.remove(mbtiles_file_name)
+
+    connection = sqlite3.connect(mbtiles_file_name)
+    connection.executescript('''
+        CREATE TABLE metadata (name TEXT, value TEXT);
+        CREATE TABLE map (zoom_level INTEGER, tile_column INTEGER, tile_row INTEGER, tile_id TEXT);
+        CREATE TABLE images (tile_data BLOB, tile_id TEXT);
+        CREATE UNIQUE INDEX map_index ON map (zoom_level, tile_column, tile_row);
+        CREATE UNIQUE INDEX images_id ON images (tile_id);
+        CREATE VIEW tiles AS
+            SELECT map.zoom_level AS zoom_level, map.tile_column AS tile_column, map.tile_row AS tile_row,
+                   images.tile_data AS tile_data
+            FROM map JOIN images ON images.tile_id = map.tile_id;
+    ''')
+    return connection
+
+
+# In-process alternative to tippecanoe_cmd.sh. Tiles of each zoom level are encoded across a process pool.
+def write_tiles_native(gdf: GeoDataFrame, mbtiles_file_name: str, workers: int = 1,
+                       simplification_pixels: float = 1.0) -> None:
+    geometries = np.asarray(reproject(gdf, WEB_MERCATOR).geometry.values)
+    years_built = gdf['year_built'].values
+    min_lon, min_lat, max_lon, max_lat = reproject(gdf, WGS84).total_bounds
+
+    with create_mbtiles(mbtiles_file_name) as connection, ProcessPoolExecutor(max(workers, 1)) as executor:
+        for zoom in range(MIN_ZOOM, MAX_ZOOM + 1):
+            futures = [
+                executor.submit(encode_tile, zoom, x, y, geometries[positions], years_built[positions],
+                                simplification_pixels)
+                for x, y, positions in tiles_for_zoom(geometries, zoom)
+            ]
+
+            unique_tiles = 0
+            for future in futures:
+                _, x, y, tile_data = future.result()
+                tile_id = hashlib.md5(tile_data).hexdigest()
+                unique_tiles += connection.execute('INSERT OR IGNORE INTO images (tile_data, tile_id) VALUES (?, ?)',
+                                                   (tile_data, tile_id)).rowcount
+                # MBTiles rows count up from the bottom (TMS), unlike XYZ
+                connection.execute('INSERT INTO map (zoom_level, tile_column, tile_row, tile_id) VALUES (?, ?, ?, ?)',
+                                   (zoom, int(x), 2 ** zoom - 1 - int(y), tile_id))
+
+            logger.debug(f'Wrote {len(futures)} tiles ({unique_tiles} unique) for zoom {zoom}...')
+
+        metadata = {
+            'name': 'buildings',
+            'format': 'pbf',
+            'minzoom': MIN_ZOOM,
+            'maxzoom': MAX_ZOOM,
+            'bounds': f'{min_lon},{min_lat},{max_lon},{max_lat}',
+            'center': f'{(min_lon + max_lon) / 2},{(min_lat + max_lat) / 2},{MIN_ZOOM}',
+            'json': json.dumps({'vector_layers': [{
+                'id': 'buildings', 'fields': {'year_built': 'Number'}, 'minzoom': MIN_ZOOM, 'maxzoom': MAX_ZOOM
+            }]})
+        }
+        connection.executemany('INSERT INTO metadata (name, value) VALUES (?, ?)',
+                               [(name, str(value)) for name, value in metadata.items()])
+
+    connection.close()
+    logger.debug(f'Size of {mbtiles_file_name} = {os.path.getsize(mbtiles_file_name) // 1000000} MB.')
+
+
+# Changes whenever this script does, so checkpoints written by older code never get reused
+CODE_VERSION = hashlib.sha1(Path(__file__).read_bytes()).hexdigest()
+
+
+def fingerprint(*file_names: str) -> List:
+    files = []
+    for file_name in file_names:
+        paths = [Path(file_name)] if not Path(file_name).is_dir() else sorted(Path(file_name).rglob('*'))
+        files += [(str(path), path.stat().st_size, path.stat().st_mtime_ns) for path in paths if path.is_file()]
+    return files
+
+
+# Reads the stage's result back from GeoParquet if a checkpoint with the same key exists, otherwise computes it and
+# writes the checkpoint. The key should cover everything the result depends on other than this script's own code.
+def checkpoint(checkpoint_dir: Optional[str], name: str, key: List,
+               compute: Callable[[], GeoDataFrame]) -> GeoDataFrame:
+    if checkpoint_dir is None:
+        return compute()
+
+    key_hash = hashlib.sha1(json.dumps([CODE_VERSION, *key], default=str).encode()).hexdigest()[:16]
+    checkpoint_file_name = f'{checkpoint_dir}/{name}-{key_hash}.parquet'
+
+    if os.path.isfile(checkpoint_file_name):
+        start_time = time.perf_counter()
+        gdf = gpd.read_parquet(checkpoint_file_name)
+        logger.info(f'Read {name} checkpoint {checkpoint_file_name} in {time.perf_counter() - start_time:.1f}s...')
+        return gdf
+
+    gdf = compute()
+
+    os.makedirs(checkpoint_dir, exist_ok=True)
+    gdf.to_parquet(f'{checkpoint_file_name}.tmp')
+    os.replace(f'{checkpoint_file_name}.tmp', checkpoint_file_name)
+    # glob() normalizes away a leading ./, so only the file names can be compared
+    for stale_file_name in Path(checkpoint_dir).glob(f'{name}-*.parquet'):
+        if stale_file_name.name != Path(checkpoint_file_name).name:
+            stale_file_name.unlink()
+
+    return gdf
+
+
+@dataclass
+class StageMetrics:
+    name: str
+    rows_in: Optional[int] = None
+    rows_out: Optional[int] = None
+    wall_seconds: float = 0
+    cpu_seconds: float = 0
+    peak_rss_mb: float = 0
+    peak_child_rss_mb: float = 0
+
+
+def cpu_seconds() -> float:
+    # Includes the process pools' workers, which get counted once they've exited
+    return sum(usage.ru_utime + usage.ru_stime for usage in
+               (resource.getrusage(resource.RUSAGE_SELF), resource.getrusage(resource.RUSAGE_CHILDREN)))
+
+
+# Times each stage of a run and writes them all out as JSON, so rebuilds can be compared across data releases
+class RunReport:
+    def __init__(self, args: argparse.Namespace):
+        self.started_at = datetime.now().isoformat()
+        self.args = vars(args)
+        self.stages: List[StageMetrics] = []
+        self.details: Dict = {}  # Anything else worth tracking across runs
+
+    @contextmanager
+    def stage(self, name: str, rows_in: Optional[int] = None) -> Iterator[StageMetrics]:
+        metrics = StageMetrics(name, rows_in=rows_in)
+        wall_start = time.perf_counter()
+        cpu_start = cpu_seconds()
+
+        try:
+            yield metrics
+        finally:
+            metrics.wall_seconds = time.perf_counter() - wall_start
+            metrics.cpu_seconds = cpu_seconds() - cpu_start
+            # Peaks are for the whole run so far, the OS doesn't track them per stage
+            metrics.peak_rss_mb = peak_rss_mb()
+            metrics.peak_child_rss_mb = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+            self.stages.append(metrics)
+
+            logger.info(f'{name}: {metrics.wall_seconds:.1f}s wall, {metrics.cpu_seconds:.1f}s CPU, '
+                        f'{metrics.rows_in} rows in, {metrics.rows_out} rows out, '
+                        f'peak RSS {metrics.peak_rss_mb:.0f} MB')
+
+    def write(self, report_file_name: str) -> None:
+        with open(report_file_name, 'w') as f:
+            json.dump({
+                'started_at': self.started_at,
+                'args': self.args,
+                'stages': [asdict(stage) for stage in self.stages],
+                'details': self.details
+            }, f, indent=2)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Builds the Columbus building age vector tiles')
+    parser.add_argument('--sources', default='sources.json',
+                        help='Config listing where to download each county\'s footprints and parcels from')
+    parser.add_argument('--parallel-sources', type=int, default=4,
+                        help='Most downloads to have going at once')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Number of processes to spread geometry repair, the join and native tiling across')
+    parser.add_argument('--osu-concurrency', type=int, default=4,
+                        help='Number of OSU building ages to fetch at once')
+    parser.add_argument('--osu-requests-per-second', type=float, default=4,
+                        help='Cap on the rate of requests to the OSU building details service')
+    parser.add_argument('--osu-cache-days', type=float, default=90,
+                        help='Age after which a cached OSU building age gets fetched again')
+    parser.add_argument('--join-mode', choices=['exact', 'point'], default='exact',
+                        help='Match each footprint to the parcel it overlaps most, or (faster, for very large '
+                             'extracts) to the parcel containing a representative point of it')
+    parser.add_argument('--join-comparison-sample', type=int, default=10_000,
+                        help='With --join-mode point, how many footprints to also join exactly to measure how often '
+                             'the two differ (0 to skip)')
+    parser.add_argument('--join-crs', choices=['native', 'wgs84'], default='native',
+                        help="Join footprints to parcels in the county's own CRS, or after reprojecting to WGS84")
+    parser.add_argument('--chunked', action='store_true',
+                        help='Process the footprints one spatial tile at a time to bound memory use, streaming the '
+                             'buildings to data/buildings.ndjson for tippecanoe')
+    parser.add_argument('--footprints-per-tile', type=int, default=50_000,
+                        help='Most footprints to hold in memory at once with --chunked')
+    parser.add_argument('--no-checkpoints', action='store_true',
+                        help="Don't resume from or write the per-stage checkpoints in data/checkpoints")
+    parser.add_argument('--full-join', action='store_true',
+                        help='Re-join every footprint instead of reusing the results of the previous run')
+    parser.add_argument('--overlap-threshold', type=float, default=0.8,
+                        help='Intersection over union above which the lower priority of two buildings is dropped, '
+                             '1 or more turns this off (exact duplicates still get dropped)')
+    parser.add_argument('--report',
+                        help='Where to write the JSON report of per-stage timings, defaults to data/run_report.json')
+    parser.add_argument('--output-mode', choices=['stream', 'geojson', 'native'], default='stream',
+                        help='Pipe features straight into tippecanoe, write data/buildings.geojson for tippecanoe '
+                             'first, or build the tiles in Python without tippecanoe')
+    parser.add_argument('--simplification', type=float, default=1.0,
+                        help='Simplification tolerance in tile pixels for --output-mode native')
+    return parser.parse_args()
+
+
+# Runs the load, join and dedup stages one spatial tile of footprints at a time, only ever reading that tile's
+# footprints and the parcels around them, and appends each tile's buildings to a newline-delimited GeoJSON file. Peak
+# memory depends on the tile size rather than the size of the region. Buildings are only deduplicated against others
+# in the same tile, and only keep their render priority order within it. Returns the number of buildings written and
+# which of the OSU buildings were written with them.
+def build_buildings_chunked(footprint_file_name: str, parcels_file_name: str, osu_buildings: GeoDataFrame,
+                            output: TextIO, footprints_per_tile: int, workers: int = 1, join_mode: str = 'exact',
+                            overlap_threshold: float = 0.8,
+                            parcel_fields: Dict[str, str] = FRANKLIN_COUNTY_PARCEL_FIELDS
+                            ) -> Tuple[int, np.ndarray]:
+    # Only the bounds of the footprints are ever held for the whole region
+    fids, bounds = pyogrio.read_bounds(footprint_file_name)
+    has_geometry = np.isfinite(bounds).all(axis=0)
+    fids, bounds = fids[has_geometry], bounds[:, has_geometry].T
+    tiles = partition_footprint_bounds(bounds, footprints_per_tile)
+
+    footprints_crs = pyproj.CRS(pyogrio.read_info(footprint_file_name)['crs'])
+    parcels_transformer = get_transformer(footprints_crs, pyproj.CRS(pyogrio.read_info(parcels_file_name)['crs']))
+
+    # Each OSU building goes with the first tile whose extent contains it, if any does
+    osu_geometries = np.asarray(reproject(osu_buildings, footprints_crs).geometry.values)
+    osu_points = shapely.get_coordinates(shapely.point_on_surface(osu_geometries))
+    osu_tiles = np.full(len(osu_buildings), -1)
+    for tile_number in reversed(range(len(tiles))):
+        min_x, min_y = bounds[tiles[tile_number], :2].min(axis=0)
+        max_x, max_y = bounds[tiles[tile_number], 2:].max(axis=0)
+        inside = ((osu_points[:, 0] >= min_x) & (osu_points[:, 0] <= max_x) &
+                  (osu_points[:, 1] >= min_y) & (osu_points[:, 1] <= max_y))
+        osu_tiles[inside] = tile_number
+
+    rows_out = 0
+    for tile_number, tile in enumerate(tiles):
+        min_x, min_y = bounds[tile, :2].min(axis=0)
+        max_x, max_y = bounds[tile, 2:].max(axis=0)
+        parcel_xs, parcel_ys = parcels_transformer.transform([min_x, min_x, max_x, max_x],
+                                                             [min_y, max_y, min_y, max_y])
+
+        footprints = load_footprints(footprint_file_name, None, workers, fids=fids[tile])
+        parcels = clean_parcel_data_frame(load_parcels(
+            parcels_file_name, footprints_crs, workers,
+            bbox=(min(parcel_xs), min(parcel_ys), max(parcel_xs), max(parcel_ys)), parcel_fields=parcel_fields
+        ))
+        footprints_with_years = join_footprints_parcels(footprints, parcels, workers, join_mode=join_mode)
+
+        combined_df = concat(reproject(footprints_with_years, WGS84), osu_buildings[osu_tiles == tile_number])
+        filtered_df = filter_intersecting_buildings(combined_df, overlap_threshold)
+        output.writelines(geojson_feature_lines(filtered_df))
+
+        rows_out += len(filtered_df)
+        logger.debug(f'Tile {tile_number + 1} of {len(tiles)}: {len(footprints)} footprints, {len(parcels)} '
+                     f'parcels, {len(filtered_df)} buildings written (peak RSS {peak_rss_mb():.0f} MB)...')
+
+    return rows_out, osu_tiles >= 0
+
+
+def main(args: argparse.Namespace):
+    data_dir = './data'
+    os.makedirs(data_dir, exist_ok=True)
 
-    footprints_with_years = join_footprints_parcels(footprints, parcels)
-    log_data_frame(footprints_with_years)
+    report = RunReport(args)
+    try:
+        build_tiles(args, data_dir, report)
+    finally:
+        report.write(args.report or f'{data_dir}/run_report.json')
+
+
+def build_tiles(args: argparse.Namespace, data_dir: str, report: RunReport) -> None:
+    counties = load_sources(args.sources)
+
+    # Each county downloads into its own directory, so two counties' zips can have the same name. A zip holding more
+    # than one of the shapefiles only gets downloaded once.
+    download_sources = {}
+    for county in counties:
+        for source in (county.footprints, county.parcels):
+            download_sources.setdefault(source.location, (source, f'{data_dir}/{county.name}'))
+
+    # Downloads everything at once, up to --parallel-sources at a time
+    with report.stage('download') as stage, ThreadPoolExecutor(args.parallel_sources) as executor:
+        future_osu_buildings = executor.submit(load_osu_buildings, f'{data_dir}/OhioState/data.gdb', data_dir,
+                                               args.osu_concurrency, args.osu_requests_per_second,
+                                               args.osu_cache_days)
+        future_zip_file_names = {
+            location: executor.submit(download_source, source, download_dir)
+            for location, (source, download_dir) in download_sources.items()
+        }
+
+        osu_buildings = future_osu_buildings.result()
+        zip_file_names = {location: future.result() for location, future in future_zip_file_names.items()}
+        stage.rows_out = len(osu_buildings)
+
+    # The zips are what change when a county publishes a new extract, so they're what the checkpoints fingerprint
+    footprint_zip_file_names = {county.name: zip_file_names[county.footprints.location] for county in counties}
+    parcels_zip_file_names = {county.name: zip_file_names[county.parcels.location] for county in counties}
+    footprint_file_names = {
+        county.name: shapefile_in_zip(footprint_zip_file_names[county.name], county.footprints.shapefile)
+        for county in counties
+    }
+    parcels_file_names = {
+        county.name: shapefile_in_zip(parcels_zip_file_names[county.name], county.parcels.shapefile)
+        for county in counties
+    }
 
-    combined_df = concat(footprints_with_years, osu_buildings)
-    log_data_frame(combined_df)
+    logger.info('Downloaded data...')
+    log_data_frame(osu_buildings, 'OSU buildings')
 
-    final_df = filter_intersecting_buildings(combined_df)
-    log_data_frame(final_df)
+    output_mbtiles_file_name = f'{data_dir}/buildings.mbtiles'
+    if args.chunked:
+        # One county at a time, since the point is to bound memory
+        output_geojson_file_name = f'{data_dir}/buildings.ndjson'
+        with report.stage('chunked') as stage, open(output_geojson_file_name, 'w') as f:
+            stage.rows_out = 0
+            remaining_osu_buildings = osu_buildings
+            for county in counties:
+                rows_out, osu_buildings_written = build_buildings_chunked(
+                    footprint_file_names[county.name], parcels_file_names[county.name], remaining_osu_buildings,
+                    f, args.footprints_per_tile, args.workers, args.join_mode, args.overlap_threshold,
+                    county.parcel_fields
+                )
+                stage.rows_out += rows_out
+                remaining_osu_buildings = remaining_osu_buildings[~osu_buildings_written]
+
+            # OSU buildings that aren't near any county's footprints
+            remaining_osu_buildings = filter_intersecting_buildings(remaining_osu_buildings, args.overlap_threshold)
+            f.writelines(geojson_feature_lines(remaining_osu_buildings))
+            stage.rows_out += len(remaining_osu_buildings)
+
+        with report.stage('tile', rows_in=stage.rows_out):
+            subprocess.check_call(['bash', 'tippecanoe_cmd.sh', output_mbtiles_file_name, output_geojson_file_name],
+                                  stderr=sys.stderr, stdout=sys.stdout)
+        return
+
+    # Joining in each county's own State Plane CRS saves reprojecting the parcels and gets the areas right. Only the
+    # joined footprints get reprojected afterwards.
+    join_crs = None if args.join_crs == 'native' else WGS84
+
+    checkpoint_dir = None if args.no_checkpoints else f'{data_dir}/checkpoints'
+    osu_key = fingerprint(f'{data_dir}/OhioState/data.gdb', f'{data_dir}/OhioState/ages.sqlite')
+
+    def county_key(county: CountySource) -> List:
+        # Parcels are put in the footprints' CRS, so everything depends on both files. The zips get fingerprinted, the
+        # /vsizip/ paths inside them aren't files as far as the OS is concerned.
+        return [county.name, fingerprint(footprint_zip_file_names[county.name]),
+                fingerprint(parcels_zip_file_names[county.name]), county.parcel_fields, args.join_crs]
+
+    # Each stage only runs if the stages after it don't have a checkpoint to resume from
+    def loaded_footprints(county: CountySource) -> GeoDataFrame:
+        def load() -> GeoDataFrame:
+            with report.stage(f'{county.name}: load footprints') as stage:
+                footprints = load_footprints(footprint_file_names[county.name], join_crs, args.workers)
+                stage.rows_out = len(footprints)
+            return footprints
+
+        footprints = checkpoint(checkpoint_dir, f'{county.name}-footprints', county_key(county), load)
+        log_data_frame(footprints, f'{county.name} footprints')
+        return footprints
+
+    def cleaned_parcels(county: CountySource, footprints_crs: pyproj.CRS) -> GeoDataFrame:
+        def load_and_clean() -> GeoDataFrame:
+            with report.stage(f'{county.name}: load parcels') as stage:
+                raw_parcels = load_parcels(parcels_file_names[county.name], footprints_crs, args.workers,
+                                           parcel_fields=county.parcel_fields)
+                stage.rows_out = len(raw_parcels)
+            with report.stage(f'{county.name}: clean', rows_in=len(raw_parcels)) as stage:
+                parcels = clean_parcel_data_frame(raw_parcels)
+                stage.rows_out = len(parcels)
+            return parcels
+
+        parcels = checkpoint(checkpoint_dir, f'{county.name}-parcels', county_key(county), load_and_clean)
+        log_data_frame(parcels, f'{county.name} parcels')
+        return parcels
+
+    def joined_footprints(county: CountySource) -> GeoDataFrame:
+        def join() -> GeoDataFrame:
+            footprints = loaded_footprints(county)
+            parcels = cleaned_parcels(county, footprints.crs)
+            logger.info(f'Loaded {county.name} County data...')
+
+            # The hashes depend on the CRS, and the two join modes can give different results
+            join_store_file_name = f'{data_dir}/join_store_{county.name}_{args.join_crs}_{args.join_mode}.json'
+            if args.full_join and os.path.isfile(join_store_file_name):
+                os.remove(join_store_file_name)
+
+            if args.join_mode == 'point' and args.join_comparison_sample > 0:
+                report.details[f'{county.name} join_mode_comparison'] = compare_join_modes(
+                    np.asarray(footprints.geometry.values), np.asarray(parcels.geometry.values),
+                    args.join_comparison_sample
+                )
+
+            with report.stage(f'{county.name}: join', rows_in=len(footprints)) as stage:
+                footprints_with_years = join_footprints_parcels(footprints, parcels, args.workers,
+                                                                join_store_file_name, args.join_mode)
+                footprints_with_years = reproject(footprints_with_years, WGS84)
+                stage.rows_out = len(footprints_with_years)
+            return footprints_with_years
+
+        footprints_with_years = checkpoint(checkpoint_dir, f'{county.name}-joined',
+                                           [*county_key(county), args.join_mode], join)
+        log_data_frame(footprints_with_years, f'{county.name} joined footprints')
+        return footprints_with_years
+
+    def filtered_buildings() -> GeoDataFrame:
+        # One county at a time. Each already spreads its repair and join across --workers processes, and forking
+        # those from several threads at once could deadlock on locks held inside GDAL, GEOS or logging.
+        counties_with_years = [joined_footprints(county) for county in counties]
+
+        rows_in = sum(len(county_with_years) for county_with_years in counties_with_years) + len(osu_buildings)
+        with report.stage('concat', rows_in=rows_in) as stage:
+            combined_df = concat(*counties_with_years, osu_buildings)
+            stage.rows_out = len(combined_df)
+        log_data_frame(combined_df, 'Combined')
+
+        with report.stage('dedup', rows_in=len(combined_df)) as stage:
+            filtered_df = filter_intersecting_buildings(combined_df, args.overlap_threshold)
+            stage.rows_out = len(filtered_df)
+        return filtered_df
+
+    final_df = checkpoint(checkpoint_dir, 'filtered',
+                          [[county_key(county) for county in counties], args.join_mode, osu_key,
+                           args.overlap_threshold], filtered_buildings)
+    log_data_frame(final_df, 'Filtered')
 
     logger.info('Joined data...')
 
-    output_geojson_file_name = f'{data_dir}/buildings.geojson'
-    output_mbtiles_file_name = f'{data_dir}/buildings.mbtiles'
-    final_df.to_file(output_geojson_file_name, driver='GeoJSON')
-    subprocess.call(['bash', 'tippecanoe_cmd.sh', output_mbtiles_file_name, output_geojson_file_name],
-                    stderr=sys.stderr, stdout=sys.stdout)
+    if args.output_mode == 'stream':
+        # Serializing and tiling overlap, so they're one stage
+        with report.stage('tile', rows_in=len(final_df)):
+            write_tiles_streaming(final_df, output_mbtiles_file_name)
+    elif args.output_mode == 'native':
+        with report.stage('tile', rows_in=len(final_df)):
+            write_tiles_native(final_df, output_mbtiles_file_name, args.workers, args.simplification)
+    else:
+        output_geojson_file_name = f'{data_dir}/buildings.geojson'
+        with report.stage('write', rows_in=len(final_df)):
+            final_df.to_file(output_geojson_file_name, driver='GeoJSON')
+        with report.stage('tile', rows_in=len(final_df)):
+            subprocess.call(['bash', 'tippecanoe_cmd.sh', output_mbtiles_file_name, output_geojson_file_name],
+                            stderr=sys.stderr, stdout=sys.stdout)
 
     logging.info('done!')
 
 
 if __name__ == '__main__':
-    main()
+    main(parse_args())
@@ -0,0 +1,40 @@
+from pathlib import Path
+
+import pytest
+import shapely
+from geopandas import GeoDataFrame
+
+from GenerateTiles import WGS84, checkpoint
+
+
+def buildings() -> GeoDataFrame:
+    return GeoDataFrame({'year_built': [1920, 1955]}, geometry=shapely.box([0, 1], [0, 1], [0.5, 1.5], [0.5, 1.5]),
+                        crs=WGS84)
+
+
+def fail() -> GeoDataFrame:
+    raise AssertionError('Recomputed instead of reading the checkpoint')
+
+
+# The pipeline's data_dir is './data', which glob() doesn't echo back
+@pytest.fixture
+def checkpoint_dir(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> str:
+    monkeypatch.chdir(tmp_path)
+    return './data/checkpoints'
+
+
+def test_second_run_reads_checkpoint(checkpoint_dir: str):
+    written = checkpoint(checkpoint_dir, 'joined', ['key'], buildings)
+    read = checkpoint(checkpoint_dir, 'joined', ['key'], fail)
+
+    assert len(list(Path(checkpoint_dir).glob('joined-*.parquet'))) == 1
+    assert read.year_built.tolist() == written.year_built.tolist()
+    assert read.geometry.geom_equals(written.geometry).all()
+
+
+def test_new_key_replaces_stale_checkpoint(checkpoint_dir: str):
+    checkpoint(checkpoint_dir, 'joined', ['old key'], buildings)
+    checkpoint(checkpoint_dir, 'joined', ['new key'], buildings)
+
+    assert len(list(Path(checkpoint_dir).glob('joined-*.parquet'))) == 1
+    checkpoint(checkpoint_dir, 'joined', ['new key'], fail)
@@ -0,0 +1,64 @@
+import pandas as pd
+import pytest
+
+from GenerateTiles import clean_parcel_id, contains_letters, sane_year_built
+
+
+# The per-row versions these replaced, which they have to keep agreeing with
+def contains_letters_per_row(s: str) -> bool:
+    return any(c.isalpha() for c in s)
+
+
+def sane_year_built_per_row(year) -> bool:
+    return 1776 <= int(year) <= 2027
+
+
+def clean_parcel_id_per_row(s: str) -> str:
+    if s[-3:] == '-00':
+        return s[:-3].strip().replace('-', '')
+    else:
+        return s.strip().replace('-', '')
+
+
+PARCEL_IDS = [
+    '010-000001',
+    '010-000001-00',  # Condo suffix
+    '010-000001-00 ',  # Whitespace after the suffix means it isn't at the end, so it stays
+    ' 010-000001-00',
+    '  010-000001  ',
+    '010-000001-01',
+    '010-00-00',
+    '-00',
+    '',
+    '010-00000A',
+    'A10-000001',
+    '010-00000É',  # Letters aren't only ASCII
+    '010_000001',
+]
+
+YEARS = [0, 1775, 1776, 1920, 2027, 2028, 1775.9, 1776.5, 2027.9, 2028.1, '1920']
+
+
+@pytest.mark.parametrize('parcel_id', PARCEL_IDS)
+def test_contains_letters_matches_per_row(parcel_id: str):
+    assert contains_letters(pd.Series([parcel_id])).iloc[0] == contains_letters_per_row(parcel_id)
+
+
+@pytest.mark.parametrize('parcel_id', PARCEL_IDS)
+def test_clean_parcel_id_matches_per_row(parcel_id: str):
+    assert clean_parcel_id(pd.Series([parcel_id])).iloc[0] == clean_parcel_id_per_row(parcel_id)
+
+
+@pytest.mark.parametrize('year', YEARS)
+def test_sane_year_built_matches_per_row(year):
+    assert sane_year_built(pd.Series([year])).iloc[0] == sane_year_built_per_row(year)
+
+
+def test_suffix_and_whitespace():
+    cleaned = clean_parcel_id(pd.Series(['010-000001-00', '010-000001-00 ', ' 010-000001 ']))
+    assert cleaned.tolist() == ['010000001', '01000000100', '010000001']
+
+
+def test_year_boundaries():
+    sane = sane_year_built(pd.Series([1775, 1776, 2027, 2028, 2027.9]))
+    assert sane.tolist() == [False, True, True, False, True]
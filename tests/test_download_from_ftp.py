@@ -0,0 +1,141 @@
+import json
+import os
+import threading
+from ftplib import FTP
+from pathlib import Path
+from typing import Iterator, List, Optional
+
+import pytest
+from pyftpdlib.authorizers import DummyAuthorizer
+from pyftpdlib.handlers import FTPHandler
+from pyftpdlib.servers import FTPServer
+
+from GenerateTiles import download_from_ftp
+
+DIRECTORY = 'GIS_Shapefiles/CurrentExtracts'
+FILE_NAME = 'Test_BuildingFootprints.zip'
+CONTENTS = bytes(range(256)) * 4000
+
+
+# Anonymous local FTP server serving DIRECTORY, yields its port
+@pytest.fixture
+def ftp_port(tmp_path: Path) -> Iterator[int]:
+    root = tmp_path / 'ftp'
+    (root / DIRECTORY).mkdir(parents=True)
+    (root / DIRECTORY / FILE_NAME).write_bytes(CONTENTS)
+
+    authorizer = DummyAuthorizer()
+    authorizer.add_anonymous(str(root))
+    handler = type('Handler', (FTPHandler,), {'authorizer': authorizer})
+    server = FTPServer(('127.0.0.1', 0), handler)
+
+    stopped = threading.Event()
+
+    def serve() -> None:
+        while not stopped.is_set():
+            server.serve_forever(timeout=0.05, blocking=False)
+        server.close_all()
+
+    thread = threading.Thread(target=serve, daemon=True)
+    thread.start()
+    yield server.address[1]
+    stopped.set()
+    thread.join()
+
+
+@pytest.fixture
+def data_dir(tmp_path: Path) -> str:
+    (tmp_path / 'data').mkdir()
+    return str(tmp_path / 'data')
+
+
+# Records the REST offset of every RETR, optionally failing instead of transferring anything
+def spy_on_retrbinary(monkeypatch: pytest.MonkeyPatch, fail: bool = False) -> List[Optional[int]]:
+    offsets = []
+    retrbinary = FTP.retrbinary
+
+    def spy(self: FTP, cmd: str, callback, blocksize: int = 8192, rest: Optional[int] = None) -> str:
+        offsets.append(rest)
+        if fail:
+            raise AssertionError(f'Unexpected {cmd}')
+        return retrbinary(self, cmd, callback, blocksize, rest)
+
+    monkeypatch.setattr(FTP, 'retrbinary', spy)
+    return offsets
+
+
+def download(port: int, data_dir: str) -> str:
+    return download_from_ftp('127.0.0.1', DIRECTORY, 'BuildingFootprints', data_dir, port)
+
+
+def load_manifest(file_name: str) -> dict:
+    with open(f'{file_name}.manifest.json', 'r') as f:
+        return json.load(f)
+
+
+# Leaves things the way a run killed partway through the transfer would
+def interrupt_download(file_name: str, partial_size: int) -> None:
+    os.replace(file_name, f'{file_name}.part')
+    with open(f'{file_name}.part', 'r+b') as f:
+        f.truncate(partial_size)
+
+    manifest = load_manifest(file_name)
+    with open(f'{file_name}.manifest.json', 'w') as f:
+        json.dump({'remote': manifest['remote'], 'complete': False}, f)
+
+
+def test_downloads_and_records_manifest(ftp_port: int, data_dir: str):
+    file_name = download(ftp_port, data_dir)
+
+    assert file_name == f'{data_dir}/{FILE_NAME}'
+    assert Path(file_name).read_bytes() == CONTENTS
+    assert not os.path.exists(f'{file_name}.part')
+    manifest = load_manifest(file_name)
+    assert manifest['complete']
+    assert manifest['remote']['size'] == len(CONTENTS)
+
+
+def test_skips_unchanged_file(ftp_port: int, data_dir: str, monkeypatch: pytest.MonkeyPatch):
+    file_name = download(ftp_port, data_dir)
+    offsets = spy_on_retrbinary(monkeypatch, fail=True)
+
+    assert download(ftp_port, data_dir) == file_name
+    assert offsets == []
+
+
+def test_resumes_partial_download(ftp_port: int, data_dir: str, monkeypatch: pytest.MonkeyPatch):
+    file_name = download(ftp_port, data_dir)
+    interrupt_download(file_name, len(CONTENTS) // 3)
+    offsets = spy_on_retrbinary(monkeypatch)
+
+    download(ftp_port, data_dir)
+
+    assert offsets == [len(CONTENTS) // 3]
+    assert Path(file_name).read_bytes() == CONTENTS
+    assert load_manifest(file_name)['complete']
+
+
+def test_finishes_complete_partial_download_without_retr(ftp_port: int, data_dir: str,
+                                                         monkeypatch: pytest.MonkeyPatch):
+    file_name = download(ftp_port, data_dir)
+    interrupt_download(file_name, len(CONTENTS))
+    offsets = spy_on_retrbinary(monkeypatch, fail=True)
+
+    download(ftp_port, data_dir)
+
+    assert offsets == []
+    assert Path(file_name).read_bytes() == CONTENTS
+    assert load_manifest(file_name)['complete']
+
+
+def test_discards_partial_download_of_changed_file(ftp_port: int, data_dir: str, monkeypatch: pytest.MonkeyPatch):
+    file_name = download(ftp_port, data_dir)
+    interrupt_download(file_name, len(CONTENTS) // 3)
+    with open(f'{file_name}.manifest.json', 'w') as f:
+        json.dump({'remote': {'size': 1, 'modified': '19700101000000'}, 'complete': False}, f)
+    offsets = spy_on_retrbinary(monkeypatch)
+
+    download(ftp_port, data_dir)
+
+    assert offsets == [None]
+    assert Path(file_name).read_bytes() == CONTENTS
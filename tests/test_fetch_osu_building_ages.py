@@ -0,0 +1,131 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterator, List
+
+import pytest
+
+import GenerateTiles
+from GenerateTiles import BuildingAgeParser, fetch_osu_building_ages
+
+
+# Answers BuildingDetailsExtended/<n> with a building built in 1900 + n, after throttling any building numbers in
+# server.throttled that many times
+class OsuHandler(BaseHTTPRequestHandler):
+    def do_GET(self) -> None:
+        server = self.server
+        building_number = self.path.rsplit('/', 1)[-1]
+        with server.lock:
+            server.requests.append((building_number, time.monotonic()))
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+            throttled = server.throttled.get(building_number, 0) > 0
+            if throttled:
+                server.throttled[building_number] -= 1
+
+        # Long enough for concurrent requests to overlap
+        time.sleep(0.05)
+        with server.lock:
+            server.in_flight -= 1
+
+        if throttled:
+            self.send_response(429)
+            if server.retry_after is not None:
+                self.send_header('Retry-After', server.retry_after)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+        else:
+            body = json.dumps({'Date Constructed': f'{1900 + int(building_number)}/01/01'}).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    def log_message(self, format: str, *args) -> None:
+        pass
+
+
+@pytest.fixture
+def osu_server() -> Iterator[ThreadingHTTPServer]:
+    server = ThreadingHTTPServer(('127.0.0.1', 0), OsuHandler)
+    server.lock = threading.Lock()
+    server.requests = []
+    server.in_flight = 0
+    server.max_in_flight = 0
+    server.throttled = {}
+    server.retry_after = None
+
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+    thread.join()
+
+
+def fetch_all(server: ThreadingHTTPServer, building_numbers: List[str], **kwargs) -> Dict[str, int]:
+    base_url = f'http://127.0.0.1:{server.server_address[1]}/BuildingDetailsExtended'
+    ages = {}
+    for num, age, outcome, error in fetch_osu_building_ages(building_numbers, BuildingAgeParser(), base_url,
+                                                            **kwargs):
+        assert error is None
+        assert outcome == 'parsed'
+        ages[num] = age
+    return ages
+
+
+def request_times(server: ThreadingHTTPServer, building_number: str) -> List[float]:
+    return [requested_at for num, requested_at in server.requests if num == building_number]
+
+
+def test_fetches_concurrently_up_to_the_limit(osu_server: ThreadingHTTPServer):
+    building_numbers = [str(num) for num in range(1, 17)]
+
+    ages = fetch_all(osu_server, building_numbers, concurrency=4, requests_per_second=200)
+
+    assert ages == {num: 1900 + int(num) for num in building_numbers}
+    assert 1 < osu_server.max_in_flight <= 4
+
+
+def test_caps_request_rate(osu_server: ThreadingHTTPServer):
+    building_numbers = [str(num) for num in range(1, 11)]
+
+    fetch_all(osu_server, building_numbers, concurrency=8, requests_per_second=20)
+
+    requested_at = sorted(requested_at for _, requested_at in osu_server.requests)
+    assert len(requested_at) == len(building_numbers)
+    assert requested_at[-1] - requested_at[0] >= (len(building_numbers) - 1) / 20 * 0.9
+
+
+def test_backs_off_on_429_through_the_rate_limiter(osu_server: ThreadingHTTPServer, monkeypatch: pytest.MonkeyPatch):
+    osu_server.throttled = {'7': 2}
+    acquired = []
+    acquire = GenerateTiles.RateLimiter.acquire
+
+    def counting_acquire(self: GenerateTiles.RateLimiter) -> None:
+        acquired.append(time.monotonic())
+        acquire(self)
+
+    monkeypatch.setattr(GenerateTiles.RateLimiter, 'acquire', counting_acquire)
+
+    ages = fetch_all(osu_server, ['7'], requests_per_second=100, backoff_factor=0.1)
+
+    assert ages == {'7': 1907}
+    requested_at = request_times(osu_server, '7')
+    assert len(requested_at) == 3
+    assert len(acquired) == 3
+    assert requested_at[1] - requested_at[0] >= 0.1
+    assert requested_at[2] - requested_at[1] >= 0.2
+
+
+def test_honors_retry_after(osu_server: ThreadingHTTPServer):
+    osu_server.throttled = {'3': 1}
+    osu_server.retry_after = '1'
+
+    ages = fetch_all(osu_server, ['3'], requests_per_second=100, backoff_factor=0)
+
+    assert ages == {'3': 1903}
+    requested_at = request_times(osu_server, '3')
+    assert requested_at[1] - requested_at[0] >= 1
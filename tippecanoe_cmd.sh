@@ -1,3 +1,4 @@
 #!/usr/bin/env bash
-tippecanoe -o $1 --minimum-zoom=11 --maximum-zoom=15 --include=year_built --read-parallel --force $2
+# Reads GeoJSON from the file given as $2, or newline-delimited GeoJSON from stdin if there isn't one
+tippecanoe -o $1 --layer=buildings --minimum-zoom=11 --maximum-zoom=15 --include=year_built --read-parallel --force $2
 echo "Size of $1 = $(($(stat -c%s "$1") / 1000000)) MB."
\ No newline at end of file